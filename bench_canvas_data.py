@@ -0,0 +1,233 @@
+'''
+Times every public canvas_data function on made up data, to catch
+performance regressions as the courses we feed through it grow.
+
+    python bench_canvas_data.py --submissions 100000 --groups 8
+
+The data comes from fake_canvas.generate_canvas: one student in one
+course with the requested number of submissions (10 to 1M). Each
+function is timed twice: cold, right after everything canvas_data
+keeps between calls is emptied (see cold_start) so it pays for
+building its SubmissionFrame/CourseSummary/indexes, and warm, when
+it can reuse them. Peak memory is measured with tracemalloc
+during another cold run. Plots are drawn with the non-interactive Agg
+backend and closed again.
+
+    python bench_canvas_data.py --memory --submissions 100000 --students 100
+
+instead measures how much memory the fetched submissions take, as the
+backend's objects and after compact_submissions (see measure_memory),
+and how long compacting them takes cold.
+'''
+import argparse
+import copy
+import gc
+import time
+import tracemalloc
+import canvas_data
+import fake_canvas
+
+USER = 'student0'
+COURSE = 1
+
+# name -> function taking (user_token, course_id)
+benchmarks = {
+    'count_courses': lambda user_token, course_id: canvas_data.count_courses(user_token),
+    'find_cs1': lambda user_token, course_id: canvas_data.find_cs1(user_token),
+    'find_course': canvas_data.find_course,
+    'render_courses': lambda user_token, course_id: canvas_data.render_courses(user_token),
+    'total_points': canvas_data.total_points,
+    'count_comments': canvas_data.count_comments,
+    'ratio_graded': canvas_data.ratio_graded,
+    'average_score': canvas_data.average_score,
+    'average_weighted': canvas_data.average_weighted,
+    'average_group': lambda user_token, course_id: canvas_data.average_group(user_token, course_id, 'Group 0'),
+    'render_summary': canvas_data.render_summary,
+    'render_assignment': lambda user_token, course_id: canvas_data.render_assignment(user_token, course_id, course_id * 100000),
+    'render_all': canvas_data.render_all,
+    'lateness_stats': canvas_data.lateness_stats,
+    'report_all': lambda user_token, course_id: canvas_data.report_all(user_token),
+    'plot_scores': canvas_data.plot_scores,
+    'plot_earliness': canvas_data.plot_earliness,
+    'plot_points': canvas_data.plot_points,
+    'predict_grades': canvas_data.predict_grades,
+}
+
+def cold_start():
+    '''
+    Empties everything canvas_data keeps between calls: fetch_cache
+    (and with it the shared compact records, which only the cached
+    submissions hold on to), the grade projections and
+    parse_timestamp's cache of parsed strings.
+    '''
+    canvas_data.use_backend(canvas_data.backend)
+    canvas_data.parse_timestamp.cache_clear()
+
+def time_function(function, repeat: int) -> tuple:
+    '''
+    Runs the function on the benchmark course cold, then `repeat`
+    times warm, and produces a tuple of the cold seconds, the best warm
+    seconds and the cold run's peak traced memory in bytes.
+    '''
+    cold_start()
+    started = time.perf_counter()
+    function(USER, COURSE)
+    cold = time.perf_counter() - started
+
+    # Measured separately, since tracing slows everything down
+    cold_start()
+    tracemalloc.start()
+    function(USER, COURSE)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    warm = None
+    for run in range(repeat):
+        started = time.perf_counter()
+        function(USER, COURSE)
+        elapsed = time.perf_counter() - started
+        if warm is None or elapsed < warm:
+            warm = elapsed
+    return cold, warm, peak
+
+def run_benchmarks(submissions: int, groups: int = 4, repeat: int = 3,
+                   names: list = None, seed: int = 0) -> list:
+    '''
+    Makes up a course with `submissions` submissions, and times each of
+    the named benchmarks on it (all of them, if names is None).
+
+    Consumes:
+    1. submissions (int): how many submissions the course has
+    2. groups (int): how many assignment groups the course has
+    3. repeat (int): how many warm runs to take the best of
+    4. names (list): which benchmarks to run
+    5. seed (int): the seed for the made up data
+    Returns: a list of dictionaries with each benchmark's name,
+    cold and warm seconds, submissions per second and peak bytes
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    canvas_data.use_backend(fake_canvas.generate_canvas(
+        users=1, courses=1, assignments=submissions, groups=groups, seed=seed))
+    results = []
+    for name in names or benchmarks:
+        cold, warm, peak = time_function(benchmarks[name], repeat)
+        plt.close('all')
+        results.append({'name': name, 'cold': cold, 'warm': warm,
+                        'throughput': submissions / cold if cold else float('inf'),
+                        'peak': peak})
+    return results
+
+def _decode_course(submissions: int, students: int, groups: int, seed: int) -> list:
+    '''
+    Makes up a course and produces a list of every student's
+    submissions in it, each deep-copied as if decoded from its own
+    response, so that no objects are shared that a real backend
+    would not share.
+    '''
+    canvas = fake_canvas.generate_canvas(users=students, courses=1,
+                                         assignments=max(1, submissions // students),
+                                         groups=groups, seed=seed)
+    return [copy.deepcopy(canvas.get_submissions('student' + str(student), COURSE))
+            for student in range(students)]
+
+def measure_memory(submissions: int, students: int = 100, groups: int = 4,
+                   seed: int = 0) -> dict:
+    '''
+    Measures with tracemalloc how much memory holding every
+    submission of a made up course takes: raw, as the backend's
+    objects, and compact, as compact_submissions' records. The data
+    is made up while tracing, so the strings that the records keep
+    alive (like timestamps and comments) are counted too. Compacting
+    is also timed cold, without tracing, since tracing slows it down.
+
+    Consumes:
+    1. submissions (int): how many submissions all students have
+    2. students (int): how many students take the course
+    3. groups (int): how many assignment groups the course has
+    4. seed (int): the seed for the made up data
+    Returns: a dictionary with the number of submissions, the
+    'raw' and 'compact' bytes and the cold compacting 'seconds'
+    '''
+    cold_start()
+    gc.collect()
+    tracemalloc.start()
+    raw = _decode_course(submissions, students, groups, seed)
+    gc.collect()
+    raw_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    counted = sum(len(decoded) for decoded in raw)
+    del raw
+    gc.collect()
+
+    tracemalloc.start()
+    compact = [canvas_data.compact_submissions(decoded)
+               for decoded in _decode_course(submissions, students, groups, seed)]
+    gc.collect()
+    compact_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del compact
+
+    cold_start()
+    raw = _decode_course(submissions, students, groups, seed)
+    started = time.perf_counter()
+    compact = [canvas_data.compact_submissions(decoded) for decoded in raw]
+    seconds = time.perf_counter() - started
+    del raw, compact
+    return {'submissions': counted, 'raw': raw_bytes, 'compact': compact_bytes,
+            'seconds': seconds}
+
+def render_memory(measured: dict) -> str:
+    '''
+    Produces a few lines describing measure_memory's result,
+    in MiB for all the submissions and per 100k of them,
+    and how long compacting them took.
+    '''
+    per = 100000 / measured['submissions'] / 2 ** 20
+    text = str(measured['submissions']) + ' submissions\n'
+    for kind in ('raw', 'compact'):
+        text += '{:<8} {:>10.2f} MiB {:>10.2f} MiB per 100k submissions\n'.format(
+            kind, measured[kind] / 2 ** 20, measured[kind] * per)
+    text += 'compacting took {:.4f} s cold, {:.2f} us per submission\n'.format(
+        measured['seconds'], measured['seconds'] / measured['submissions'] * 1e6)
+    return text
+
+def render_results(results: list) -> str:
+    '''
+    Produces a table of benchmark results, one line per benchmark.
+    '''
+    table = '{:<18} {:>10} {:>10} {:>14} {:>10}\n'.format(
+        'function', 'cold s', 'warm s', 'submissions/s', 'peak MiB')
+    for result in results:
+        table += '{:<18} {:>10.4f} {:>10.6f} {:>14,.0f} {:>10.2f}\n'.format(
+            result['name'], result['cold'], result['warm'],
+            result['throughput'], result['peak'] / 2 ** 20)
+    return table
+
+def cli(argv: list = None):
+    parser = argparse.ArgumentParser(description='Benchmark canvas_data on made up data.')
+    parser.add_argument('--submissions', type=int, default=10000,
+                        help='how many submissions the course has (10 to 1000000)')
+    parser.add_argument('--groups', type=int, default=4,
+                        help='how many assignment groups the course has')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='how many warm runs to take the best of')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true',
+                        help='measure the memory of raw and compact submissions instead')
+    parser.add_argument('--students', type=int, default=100,
+                        help='how many students share the submissions, with --memory')
+    parser.add_argument('names', nargs='*', help='which benchmarks to run (default: all)')
+    args = parser.parse_args(argv)
+    if args.memory:
+        print (render_memory(measure_memory(args.submissions, args.students,
+                                            args.groups, args.seed)), end='')
+        return
+    results = run_benchmarks(args.submissions, args.groups, args.repeat,
+                             args.names or None, args.seed)
+    print (render_results(results), end='')
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,162 @@
+'''
+Renders canvas_data's four charts (scores, earliness, points and
+grades) to image files without a display, for weekly reports.
+
+    render_roster(['annie', 'jeff', 'troy'], 'reports', 'svg')
+
+or from the command line:
+
+    python canvas_charts.py reports annie jeff troy --format svg
+
+Every chart of every course of every user is written to
+DIRECTORY/USER_COURSE_CHART.FORMAT. Users are split over a pool of
+worker processes, each of which draws with the non-interactive Agg
+backend on a single figure that it clears and reuses for every chart.
+Matplotlib is not thread-safe, so there is no thread pool option.
+Workers start with canvas_data's current backend, as in canvas_cohort.
+'''
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import os
+import canvas_cohort
+import canvas_data
+
+# chart name -> function drawing it, taking (user_token, course_id, path)
+CHARTS = {
+    'scores': lambda user_token, course_id, path:
+        canvas_data.plot_scores(user_token, course_id, path=path),
+    'earliness': canvas_data.plot_earliness,
+    'points': canvas_data.plot_points,
+    'grades': canvas_data.predict_grades,
+}
+
+def _start_worker(backend, directory: str, format: str):
+    '''
+    Runs in every worker process before its first user, switching
+    to the parent's backend and to saving charts with Agg.
+    '''
+    canvas_cohort.start_worker(backend)
+    canvas_data.save_plots(directory, format)
+
+def render_course(user_token: str, course_id: int) -> list:
+    '''
+    Consumes a user_token and a course_id and saves every chart of
+    the course where canvas_data.plot_path says (see
+    canvas_data.save_plots). Charts that have nothing to draw, like
+    grades for a course without weights, are skipped.
+
+    Consumes:
+    1. user_token (str): a string that represents the user's
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a list of the files written
+    '''
+    written = []
+    for chart, plot in CHARTS.items():
+        path = plot(user_token, course_id, canvas_data.plot_path(user_token, course_id, chart))
+        if path is not None:
+            written.append(path)
+    return written
+
+def render_user(user_token: str) -> list:
+    '''
+    Saves every chart of every one of the user's courses, and
+    produces a list of the files written. A course whose data
+    cannot be fetched is skipped.
+    '''
+    written = []
+    for course in canvas_data.fetch_courses(user_token):
+        try:
+            written.extend(render_course(user_token, course.id))
+        except Exception:
+            continue
+    return written
+
+def _render_users(user_tokens: list) -> list:
+    '''
+    Produces a (user_token, files written) pair for every user,
+    with None for users whose courses could not be fetched.
+    '''
+    rendered = []
+    for user_token in user_tokens:
+        try:
+            rendered.append((user_token, render_user(user_token)))
+        except Exception:
+            rendered.append((user_token, None))
+    return rendered
+
+def render_roster(user_tokens: list, directory: str, format: str = 'png',
+                  max_workers: int = None, chunk_size: int = None) -> dict:
+    '''
+    Consumes a list of user_tokens and saves all four charts of every
+    one of their courses as `format` files in the directory, rendering
+    the users in chunks on a pool of worker processes.
+
+    Consumes:
+    1. user_tokens (list): the users to render charts for
+    2. directory (str): where to save the charts
+    3. format (str): the image format, like 'png' or 'svg'
+    4. max_workers (int): how many processes to use (one per core if
+                          None); with 1, everything runs right here,
+                          and matplotlib's backend is switched back
+                          afterwards
+    5. chunk_size (int): how many users each task handles
+    Returns: a dictionary of user_token -> list of files written
+    (None for users whose courses could not be fetched)
+    '''
+    user_tokens = list(user_tokens)
+    os.makedirs(directory, exist_ok=True)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(user_tokens) //
+                              (max_workers * canvas_cohort.CHUNKS_PER_WORKER)))
+    chunks = [user_tokens[start:start + chunk_size]
+              for start in range(0, len(user_tokens), chunk_size)]
+
+    rendered = {}
+    if max_workers == 1 or len(chunks) <= 1:
+        import matplotlib
+        previous = (canvas_data.plot_directory, canvas_data.plot_format,
+                    matplotlib.get_backend())
+        canvas_data.save_plots(directory, format)
+        try:
+            for chunk in chunks:
+                rendered.update(_render_users(chunk))
+        finally:
+            canvas_data.plot_directory, canvas_data.plot_format = previous[:2]
+            matplotlib.use(previous[2])
+        return rendered
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_start_worker,
+                             initargs=(canvas_cohort.worker_backend(), directory,
+                                       format)) as pool:
+        for chunk_rendered in pool.map(_render_users, chunks):
+            rendered.update(chunk_rendered)
+    return rendered
+
+def cli(argv: list = None):
+    parser = argparse.ArgumentParser(description='Save every chart of every course as image files.')
+    parser.add_argument('directory', help='where to save the charts')
+    parser.add_argument('user_tokens', nargs='*', help='the users to render charts for')
+    parser.add_argument('--roster', metavar='FILE',
+                        help='a file with one more user_token per line')
+    parser.add_argument('--format', default='png',
+                        help='the image format (png, svg, pdf, ...)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many processes to use (default: one per core)')
+    args = parser.parse_args(argv)
+    user_tokens = list(args.user_tokens)
+    if args.roster:
+        with open(args.roster) as roster:
+            user_tokens.extend(line.strip() for line in roster if line.strip())
+    rendered = render_roster(user_tokens, args.directory, args.format, args.workers)
+    files = sum(len(paths) for paths in rendered.values() if paths is not None)
+    failed = [user_token for user_token, paths in rendered.items() if paths is None]
+    print (str(files) + ' charts written to ' + args.directory)
+    if failed:
+        print ('could not render: ' + ' '.join(failed))
+
+if __name__ == '__main__':
+    cli()
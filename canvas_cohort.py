@@ -0,0 +1,272 @@
+'''
+Course-wide statistics across many students, for instructors: the
+weighted averages, graded ratios and late submissions of everyone on
+a roster, reduced into one CohortStats.
+
+    stats = cohort_stats(679554, ['annie', 'jeff', 'troy', ...])
+    print (render_cohort(stats))
+
+or from the command line, with one user_token per line in a file:
+
+    python canvas_cohort.py 679554 --roster roster.txt
+
+The roster is split into chunks that run on a pool of worker
+processes (or threads), each of which fetches its students through
+canvas_data and sends back one small tuple per student, so the work
+grows with the number of cores instead of with the roster. Worker
+processes are started with canvas_data's current backend, which has
+to be a module (like bakery_canvas) or picklable (like a FakeCanvas);
+use processes=False for anything else, such as a SnapshotBackend.
+'''
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import importlib
+import json
+import os
+import types
+import numpy as np
+import canvas_data
+
+# How many chunks to give each worker, so that a slow chunk near the
+# end does not leave the other workers idle
+CHUNKS_PER_WORKER = 4
+
+def worker_backend():
+    '''
+    Produces canvas_data's current backend in a form that can be sent
+    to worker processes: a module's name, or the backend itself.
+    '''
+    if isinstance(canvas_data.backend, types.ModuleType):
+        return canvas_data.backend.__name__
+    return canvas_data.backend
+
+def start_worker(backend):
+    '''
+    Runs in every worker process before its first chunk, switching
+    canvas_data to the parent's backend (or the module named backend).
+    '''
+    if isinstance(backend, str):
+        backend = importlib.import_module(backend)
+    canvas_data.use_backend(backend)
+
+def student_record(user_token: str, course_id: int) -> tuple:
+    '''
+    Consumes a user_token and a course_id and produces a tuple of the
+    student's weighted average, graded and total submissions, and
+    late and dated submissions (those with both a due date and a
+    submission date), from the same CourseSummary and lateness as
+    average_weighted, ratio_graded and lateness_stats.
+
+    Consumes:
+    1. user_token (str): a string that represents the user's
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a tuple (average_weighted, graded, total, late, dated)
+    '''
+    summary = canvas_data.course_summary(user_token, course_id)
+    days = canvas_data.course_frame(user_token, course_id).lateness_days()
+    return (summary.average_weighted(), summary.graded,
+            summary.graded + summary.ungraded,
+            int(np.count_nonzero(days > 0)), len(days))
+
+def _run_chunk(course_id: int, user_tokens: list) -> list:
+    '''
+    Produces a (user_token, record or None) pair for every student in
+    the chunk. Only the small records leave the worker; the fetched
+    submissions stay behind in its fetch_cache, whose size is capped.
+    '''
+    records = []
+    for user_token in user_tokens:
+        try:
+            record = student_record(user_token, course_id)
+        except Exception:
+            record = None
+        records.append((user_token, record))
+    return records
+
+class CohortStats:
+    '''
+    The reduced statistics of every student on a roster in one course.
+    Students who are not enrolled (no submissions at all) or whose
+    data could not be fetched are left out, and listed in `missing`.
+
+    Consumes:
+    1. course_id (int): the course the statistics are about
+    2. records (list): (user_token, record) pairs from student_record,
+                       with None for the students that are missing
+    '''
+    def __init__(self, course_id: int, records: list):
+        self.course_id = course_id
+        self.user_tokens = []
+        self.missing = []
+        averages = []
+        graded = []
+        total = []
+        late = []
+        dated = []
+        for user_token, record in records:
+            if record is None or record[2] == 0:
+                self.missing.append(user_token)
+                continue
+            self.user_tokens.append(user_token)
+            averages.append(record[0])
+            graded.append(record[1])
+            total.append(record[2])
+            late.append(record[3])
+            dated.append(record[4])
+        self.averages = np.array(averages, dtype=np.float64)
+        self.graded = np.array(graded, dtype=np.int64)
+        self.total = np.array(total, dtype=np.int64)
+        self.late = np.array(late, dtype=np.int64)
+        self.dated = np.array(dated, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.user_tokens)
+
+    def graded_ratios(self):
+        '''
+        Produces an array of every student's fraction of graded submissions.
+        '''
+        return self.graded / self.total
+
+    def late_rates(self):
+        '''
+        Produces an array of every student's percent of late submissions,
+        0.0 for students with nothing submitted with a due date.
+        '''
+        return np.divide(self.late * 100.0, self.dated,
+                         out=np.zeros(len(self)), where=self.dated > 0)
+
+    def percent_late(self) -> float:
+        '''
+        Produces the percent of all the cohort's dated submissions
+        that were late, or 0.0 if there are none.
+        '''
+        dated = int(self.dated.sum())
+        if dated == 0:
+            return 0.0
+        return int(self.late.sum()) * 100 / dated
+
+    def as_dict(self) -> dict:
+        '''
+        Produces a dictionary of the cohort's statistics: how many
+        students there are, the mean, median and spread of their
+        weighted averages, how their graded ratios are distributed
+        (students per tenth, from 0.0-0.1 up to 0.9-1.0) and the
+        overall and per-student late rates.
+        '''
+        if len(self) == 0:
+            return {'course_id': self.course_id, 'students': 0,
+                    'missing': len(self.missing)}
+        ratios, edges = np.histogram(self.graded_ratios(), bins=10, range=(0.0, 1.0))
+        late_rates = self.late_rates()
+        return {'course_id': self.course_id,
+                'students': len(self),
+                'missing': len(self.missing),
+                'average_weighted': {'mean': float(np.mean(self.averages)),
+                                     'median': float(np.median(self.averages)),
+                                     'min': float(np.min(self.averages)),
+                                     'max': float(np.max(self.averages))},
+                'graded_ratio': {'mean': float(np.mean(self.graded_ratios())),
+                                 'distribution': [int(count) for count in ratios]},
+                'percent_late': self.percent_late(),
+                'student_percent_late': {'mean': float(np.mean(late_rates)),
+                                         'median': float(np.median(late_rates))}}
+
+def _chunks(user_tokens: list, chunk_size: int) -> list:
+    return [user_tokens[start:start + chunk_size]
+            for start in range(0, len(user_tokens), chunk_size)]
+
+def cohort_stats(course_id: int, user_tokens: list, max_workers: int = None,
+                 chunk_size: int = None, processes: bool = True) -> CohortStats:
+    '''
+    Consumes a course_id and a roster of user_tokens and produces the
+    CohortStats of every student on it, fetching and reducing the
+    students in chunks on a pool of workers.
+
+    Consumes:
+    1. course_id (int): an integer representing the ID
+                        of the course
+    2. user_tokens (list): the user_tokens of the students
+    3. max_workers (int): how many workers to use (one per core if
+                          None); with 1, everything runs right here
+    4. chunk_size (int): how many students each task handles (enough
+                         for CHUNKS_PER_WORKER tasks a worker if None)
+    5. processes (bool): whether the workers are processes, which
+                         use every core, or threads, which share
+                         this process's backend and fetch_cache
+    Returns: a CohortStats of the course
+    '''
+    user_tokens = list(user_tokens)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, -(-len(user_tokens) // (max_workers * CHUNKS_PER_WORKER)))
+    chunks = _chunks(user_tokens, chunk_size)
+
+    if max_workers == 1 or len(chunks) <= 1:
+        records = []
+        for chunk in chunks:
+            records.extend(_run_chunk(course_id, chunk))
+        return CohortStats(course_id, records)
+
+    if processes:
+        pool = ProcessPoolExecutor(max_workers=max_workers, initializer=start_worker,
+                                   initargs=(worker_backend(),))
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+    records = []
+    with pool:
+        for chunk_records in pool.map(_run_chunk, [course_id] * len(chunks), chunks):
+            records.extend(chunk_records)
+    return CohortStats(course_id, records)
+
+def render_cohort(stats: CohortStats) -> str:
+    '''
+    Produces a few lines describing a CohortStats for people to read.
+    '''
+    data = stats.as_dict()
+    text = ('course ' + str(stats.course_id) + ': ' + str(data['students']) +
+            ' students (' + str(data['missing']) + ' missing)\n')
+    if data['students'] == 0:
+        return text
+    averages = data['average_weighted']
+    text += ('weighted average | mean ' + str(round(averages['mean'], 4)) +
+             ' | median ' + str(round(averages['median'], 4)) +
+             ' | range ' + str(round(averages['min'], 4)) + '-' +
+             str(round(averages['max'], 4)) + '\n')
+    text += ('graded ratio | mean ' + str(round(data['graded_ratio']['mean'], 4)) +
+             ' | students per tenth ' + str(data['graded_ratio']['distribution']) + '\n')
+    text += ('late | ' + str(round(data['percent_late'], 2)) + '% of submissions | ' +
+             str(round(data['student_percent_late']['median'], 2)) + '% median per student\n')
+    return text
+
+def cli(argv: list = None):
+    parser = argparse.ArgumentParser(description='Statistics across every student in a course.')
+    parser.add_argument('course_id', type=int)
+    parser.add_argument('user_tokens', nargs='*', help='the students on the roster')
+    parser.add_argument('--roster', metavar='FILE',
+                        help='a file with one more user_token per line')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='how many workers to use (default: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                        help='how many students each task handles')
+    parser.add_argument('--threads', action='store_true',
+                        help='use threads instead of processes')
+    parser.add_argument('--json', action='store_true',
+                        help='print the statistics as JSON')
+    args = parser.parse_args(argv)
+    user_tokens = list(args.user_tokens)
+    if args.roster:
+        with open(args.roster) as roster:
+            user_tokens.extend(line.strip() for line in roster if line.strip())
+    stats = cohort_stats(args.course_id, user_tokens, args.workers,
+                         args.chunk_size, not args.threads)
+    if args.json:
+        print (json.dumps(stats.as_dict()))
+    else:
+        print (render_cohort(stats), end='')
+
+if __name__ == '__main__':
+    cli()
@@ -1,26 +1,1238 @@
-from bakery import assert_equal
-from bakery_canvas import get_submissions
-import matplotlib.pyplot as plt
-from bakery_canvas import get_courses
-from datetime import datetime
+import bakery_canvas
+import numpy as np
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from functools import cached_property, lru_cache, wraps
+import argparse
+import cProfile
+import io
+import itertools
+import json
+import operator
+import os
+import pstats
+import re
+import shlex
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, wait
+import sys
+import threading
+import time
+import weakref
 
 help_commands = """
 exit > Exit the application
 help > List all the commands
 course > Change current course
+all > Print points, graded ratio and weighted score of every course
 points > Print total points in course
 comments > Print how many comments in course
 graded > Print ratio of ungraded/graded assignments
 score_unweighted > Print average unweighted score
 score > Print average weighted score
 group > Print average of assignment group, by name
+groups > Print the weight, graded ratio and average of every assignment group
+summary > Print every statistic about the course at once
 assignment > Print the details of a specific assignment, by ID
 list > List all the assignments in the course
+export > Save every submission in the course to a CSV, Parquet or Arrow file
 scores > Plot the distribution of grades in the course
+percentiles > Print the median and 90th percentile of the scores in the course
 earliness > Plot the distribution of the days assignments were submitted early
+lateness > Print the mean and median days late and the percent of late submissions
 compare > Plot the relationship between assignments' points possible and their weighted points possible
 predict > Plot the trends in grades over assignments, showing max ever possible, max still possible, and minimum still possible
+projection > Print the max ever possible, max still possible and minimum still possible grades
+whatif > Simulate the ungraded work to print the likely final grade and the chance of each letter grade
+refresh > Throw away cached course data and fetch it again
+cache > Print how often the course data cache was used, and how busy the backend was
+stats > Print where each command's time went (the first time, start timing them)
+profile > Start or stop profiling commands with cProfile
 """
+
+class FetchCache:
+    '''
+    A session-scoped cache for the results of the Canvas fetchers,
+    keyed by (user_token, course_id). get_courses results are stored
+    under a course_id of None.
+    
+    Entries older than `ttl` seconds are fetched again, and once more
+    than `max_size` entries are held the least recently used one
+    is thrown away. When several threads ask for the same missing
+    entry at once, only the first fetches it and the others wait
+    for its result (`coalesced` counts how often that happened).
+    
+    Consumes:
+    1. ttl (float): how many seconds an entry stays fresh, or None
+                    to keep entries until they are evicted
+    2. max_size (int): the largest number of entries to hold
+    '''
+    def __init__(self, ttl: float = 300.0, max_size: int = 64):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        # (user_token, course_id) -> Future of the fetch in flight
+        self._in_flight = {}
+        # Held only while reading or changing _entries, never while fetching
+        self._lock = threading.Lock()
+    
+    def lookup(self, user_token: str, course_id) -> tuple:
+        '''
+        Produces a tuple of whether (user_token, course_id) has a
+        fresh entry, and its value (or None), counting the hit or miss.
+        '''
+        key = (user_token, course_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.ttl is None or time.monotonic() - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+    
+    def store(self, user_token: str, course_id, value, stored_at: float = None):
+        '''
+        Stores a freshly fetched value for (user_token, course_id),
+        evicting the least recently used entries if there are too many.
+        '''
+        if stored_at is None:
+            stored_at = time.monotonic()
+        with self._lock:
+            self._entries[(user_token, course_id)] = (stored_at, value, {})
+            self._entries.move_to_end((user_token, course_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def get(self, user_token: str, course_id, fetch):
+        '''
+        Produces the cached value for (user_token, course_id),
+        calling `fetch` with no arguments to load it if it is
+        missing or has expired. Safe to call from several threads:
+        if the same entry is already being fetched, this waits for
+        that fetch (and its result or exception) instead. If that
+        fetch was abandoned rather than failing, this tries again.
+        '''
+        while True:
+            found, value = self.lookup(user_token, course_id)
+            if found:
+                return value
+            action, value = self._claim(user_token, course_id)
+            if action == 'stored':
+                return value
+            if action == 'fetch':
+                break
+            try:
+                return value.result()
+            except CancelledError:
+                if not value.cancelled():
+                    raise
+        
+        stored_at = time.monotonic()
+        try:
+            value = fetch()
+        except BaseException as error:
+            self._settle(user_token, course_id, stored_at, error=error)
+            raise
+        self._settle(user_token, course_id, stored_at, value)
+        return value
+    
+    async def aget(self, user_token: str, course_id, fetch):
+        '''
+        The async version of get, awaiting the coroutine function
+        `fetch` to load a missing or expired entry. Fetches in flight
+        are shared with get, so the same entry is only fetched once
+        however many threads and tasks ask for it at the same time.
+        
+        The fetch runs in its own task, so cancelling the task that
+        started it (say, on a timeout) does not cancel it for the
+        others waiting: it still finishes and is cached.
+        '''
+        import asyncio
+        while True:
+            found, value = self.lookup(user_token, course_id)
+            if found:
+                return value
+            action, value = self._claim(user_token, course_id)
+            if action == 'stored':
+                return value
+            if action == 'fetch':
+                break
+            try:
+                # Shielded, so that a cancelled waiter does not cancel the fetch
+                return await asyncio.shield(asyncio.wrap_future(value))
+            except asyncio.CancelledError:
+                # The fetch was abandoned, not this task, so claim it again
+                if not value.cancelled():
+                    raise
+        
+        async def fetch_and_settle():
+            stored_at = time.monotonic()
+            try:
+                value = await fetch()
+            except BaseException as error:
+                self._settle(user_token, course_id, stored_at, error=error)
+                raise
+            self._settle(user_token, course_id, stored_at, value)
+            return value
+        return await asyncio.shield(asyncio.ensure_future(fetch_and_settle()))
+    
+    def _claim(self, user_token: str, course_id) -> tuple:
+        '''
+        Decides what to do after a missed lookup, producing
+        ('stored', value) if a fetch finished since the lookup,
+        ('wait', Future) if one is in flight, or ('fetch', None)
+        if the caller has to fetch the entry and then _settle it.
+        '''
+        key = (user_token, course_id)
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return 'wait', flight
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or
+                                      time.monotonic() - entry[0] < self.ttl):
+                return 'stored', entry[1]
+            self._in_flight[key] = Future()
+            return 'fetch', None
+    
+    def _settle(self, user_token: str, course_id, stored_at: float, value=None,
+                error: BaseException = None):
+        '''
+        Finishes a claimed fetch, storing its value (unless it failed)
+        and handing the value or error to everyone waiting for it.
+        A fetch stopped by anything but an Exception (it was cancelled,
+        or interrupted) is abandoned instead, and the waiters claim
+        it again, since what stopped it was not about the data.
+        '''
+        if error is None:
+            self.store(user_token, course_id, value, stored_at)
+        with self._lock:
+            flight = self._in_flight.pop((user_token, course_id))
+        if error is None:
+            flight.set_result(value)
+        elif isinstance(error, Exception):
+            flight.set_exception(error)
+        else:
+            flight.cancel()
+    
+    def derive(self, user_token: str, course_id, name: str, source, build):
+        '''
+        Produces a value computed from `source`, the value fetched for
+        (user_token, course_id), calling `build` with no arguments the
+        first time `name` is asked for. Derived values are thrown away
+        along with their entry, so they never outlive the data they
+        were computed from. If the entry no longer holds `source` (it
+        expired, or was fetched again since), the value is built and
+        not cached, so it is never kept with data it did not come from.
+        '''
+        with self._lock:
+            entry = self._entries.get((user_token, course_id))
+            if entry is not None and entry[1] is not source:
+                entry = None
+            if entry is not None and name in entry[2]:
+                return entry[2][name]
+        value = build()
+        if entry is None:
+            return value
+        with self._lock:
+            return entry[2].setdefault(name, value)
+    
+    def invalidate(self, user_token: str = None, course_id=None):
+        '''
+        Throws away the cached entries for a user_token (or every
+        user, if it is None). If a course_id is given only that
+        course's submissions are thrown away.
+        '''
+        with self._lock:
+            for key in list(self._entries):
+                if user_token is not None and key[0] != user_token:
+                    continue
+                if course_id is not None and key[1] != course_id:
+                    continue
+                del self._entries[key]
+    
+    def render_stats(self) -> str:
+        '''
+        Produces a string describing the number of entries held
+        and how many lookups were hits, misses and coalesced.
+        '''
+        return (str(len(self._entries)) + ' entries, ' + str(self.hits) +
+                ' hits, ' + str(self.misses) + ' misses, ' +
+                str(self.coalesced) + ' coalesced')
+
+fetch_cache = FetchCache()
+
+class BackendLimiter:
+    '''
+    Protects the backend from bursts: at most `max_concurrent` calls
+    run at once, and if a `rate` is given, calls start at least
+    1/rate seconds apart. Safe to share between threads.
+    
+    Consumes:
+    1. max_concurrent (int): how many calls may run at once
+    2. rate (float): how many calls may start per second,
+                     or None for no limit
+    '''
+    def __init__(self, max_concurrent: int = 8, rate: float = None):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.calls = 0
+        self.waited = 0.0
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+    
+    def _take_turn(self) -> float:
+        '''
+        Counts a call and produces how many seconds
+        it has to wait to start, under the rate limit.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if not self.rate:
+                return 0.0
+            start = max(now, self._next_start)
+            self._next_start = start + 1 / self.rate
+            self.waited += start - now
+        return start - now
+    
+    def call(self, fetch, *args):
+        '''
+        Calls fetch with args once a slot is free and
+        the rate allows it, and produces its result.
+        '''
+        with self._slots:
+            delay = self._take_turn()
+            if delay > 0:
+                time.sleep(delay)
+            return fetch(*args)
+    
+    async def acall(self, fetch, *args):
+        '''
+        The async version of call, for a coroutine function fetch:
+        waits for a slot and the rate limit without blocking the
+        event loop, sharing both with call.
+        '''
+        import asyncio
+        if not self._slots.acquire(blocking=False):
+            waiting = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+            try:
+                await asyncio.shield(waiting)
+            except asyncio.CancelledError:
+                # The thread still takes the slot, so give it back once it has
+                waiting.add_done_callback(lambda acquired: self._slots.release())
+                raise
+        try:
+            delay = self._take_turn()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await fetch(*args)
+        finally:
+            self._slots.release()
+    
+    def render_stats(self) -> str:
+        '''
+        Produces a string describing the limits, the calls
+        made and the seconds spent waiting for the rate limit.
+        '''
+        rate = 'no rate limit' if not self.rate else str(self.rate) + ' calls/s'
+        return (str(self.calls) + ' backend calls (at most ' + str(self.max_concurrent) +
+                ' at once, ' + rate + '), ' + str(round(self.waited, 3)) + 's waited')
+
+backend_limiter = BackendLimiter()
+
+def limit_backend(max_concurrent: int = 8, rate: float = None):
+    '''
+    Replaces backend_limiter, so that from now on at most
+    max_concurrent backend calls run at once and at most
+    `rate` of them start per second (no limit if None).
+    '''
+    global backend_limiter
+    backend_limiter = BackendLimiter(max_concurrent, rate)
+
+# Where courses and submissions come from: any object with
+# get_courses(user_token) and get_submissions(user_token, course_id)
+backend = bakery_canvas
+
+def use_backend(new_backend):
+    '''
+    Consumes an object with get_courses and get_submissions functions
+    (like the bakery_canvas module, or a fake_canvas.FakeCanvas) and
+    makes every function in this module fetch from it instead.
+    The cache is emptied, since it holds the old backend's data.
+    
+    Consumes:
+    1. new_backend: the object to fetch courses and submissions from
+    Returns: nothing
+    '''
+    global backend
+    backend = new_backend
+    fetch_cache.invalidate()
+    drop_projections()
+
+class Phase:
+    '''
+    Times a phase ('render', say) of the current command for
+    Instruments, leaving out any backend fetches made during it.
+    Does nothing when the Instruments are disabled.
+    '''
+    def __init__(self, instruments, name: str):
+        self.instruments = instruments
+        self.name = name
+    
+    def __enter__(self):
+        if self.instruments.enabled:
+            self.started = time.perf_counter()
+            self.fetch_before = self.instruments.current['fetch']
+        return self
+    
+    def __exit__(self, *exception):
+        if self.instruments.enabled:
+            current = self.instruments.current
+            fetched = current['fetch'] - self.fetch_before
+            current[self.name] += time.perf_counter() - self.started - fetched
+        return False
+
+class Instruments:
+    '''
+    Records where the time of each command given to execute goes,
+    once `enabled` is True: wall time split into fetch (waiting on
+    the backend), render (plotting and writing output), input (waiting
+    on the user at a prompt) and compute (everything else), plus how
+    many backend calls were made and how many objects (courses or
+    submissions) they produced.
+    
+    Fetches made outside of a command (like main's startup fetch) are
+    counted under the command None. When disabled, every hook is a
+    single attribute check.
+    
+    An optional cProfile profiler can also be run around commands.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.profiler = None
+        self.records = []
+        self.current = self._new_record(None)
+        self.outside = self.current
+        self._lock = threading.Lock()
+    
+    def _new_record(self, command) -> dict:
+        return {'command': command, 'seconds': 0.0, 'fetch': 0.0, 'compute': 0.0,
+                'render': 0.0, 'input': 0.0, 'backend_calls': 0, 'objects': 0}
+    
+    def around_command(self, function):
+        '''
+        Wraps execute so that each command it runs is recorded
+        (and profiled, if the profiler is on).
+        '''
+        @wraps(function)
+        def timed(command, *args):
+            if not self.enabled and self.profiler is None:
+                return function(command, *args)
+            record = self._new_record(command)
+            self.current = record
+            started = time.perf_counter()
+            if self.profiler is not None:
+                self.profiler.enable()
+            try:
+                return function(command, *args)
+            finally:
+                if self.profiler is not None:
+                    self.profiler.disable()
+                record['seconds'] = time.perf_counter() - started
+                # Worker threads can overlap their fetches, so never go below 0
+                record['compute'] = max(0.0, record['seconds'] - record['fetch'] -
+                                        record['render'] - record['input'])
+                self.current = self.outside
+                if self.enabled:
+                    self.records.append(record)
+        return timed
+    
+    def call_backend(self, fetch, *args):
+        '''
+        Calls a backend function with args and produces its result,
+        recording the call against the current command.
+        '''
+        if not self.enabled:
+            return fetch(*args)
+        started = time.perf_counter()
+        value = fetch(*args)
+        self.record_fetch(time.perf_counter() - started, value)
+        return value
+    
+    def record_fetch(self, seconds: float, value):
+        '''
+        Records a backend call that took `seconds` and
+        produced `value` against the current command.
+        '''
+        with self._lock:
+            self.current['fetch'] += seconds
+            self.current['backend_calls'] += 1
+            self.current['objects'] += len(value)
+    
+    def phase(self, name: str) -> Phase:
+        '''
+        Produces a context manager timing the named phase.
+        '''
+        return Phase(self, name)
+    
+    def toggle_profiler(self) -> str:
+        '''
+        Starts profiling commands with cProfile, or stops and
+        produces the profile's 20 most expensive functions.
+        '''
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            return 'Profiling commands until you type "profile" again'
+        report = io.StringIO()
+        pstats.Stats(self.profiler, stream=report).sort_stats('cumulative').print_stats(20)
+        self.profiler = None
+        return report.getvalue()
+    
+    def render_stats(self) -> str:
+        '''
+        Produces a table with one line per command name: how many
+        times it ran, its average milliseconds in each phase, and its
+        total backend calls and objects fetched.
+        '''
+        totals = OrderedDict()
+        for record in [self.outside] + self.records:
+            name = str(record['command'])
+            if name not in totals:
+                totals[name] = self._new_record(name)
+                totals[name]['runs'] = 0
+            for key in ('seconds', 'fetch', 'compute', 'render', 'input',
+                        'backend_calls', 'objects'):
+                totals[name][key] += record[key]
+            totals[name]['runs'] += 1
+        table = ('command | runs | ms | fetch ms | compute ms | render ms | input ms | '
+                 'backend calls | objects\n')
+        for name, total in totals.items():
+            runs = total['runs']
+            table += (name + ' | ' + str(runs) + ' | ' +
+                      ' | '.join(str(round(total[key] / runs * 1000, 3))
+                                 for key in ('seconds', 'fetch', 'compute', 'render', 'input')) +
+                      ' | ' + str(total['backend_calls']) + ' | ' + str(total['objects']) + '\n')
+        return table + 'cache: ' + fetch_cache.render_stats()
+    
+    def dump(self, path: str):
+        '''
+        Writes every record, and the cache counters, to path as JSON.
+        '''
+        with open(path, 'w') as stats_file:
+            json.dump({'outside_commands': self.outside, 'commands': self.records,
+                       'cache': {'hits': fetch_cache.hits, 'misses': fetch_cache.misses}},
+                      stats_file, indent=2)
+
+instruments = Instruments()
+
+def call_backend(fetch, *args):
+    '''
+    Calls a backend function with args within backend_limiter's
+    limits, recording it with instruments, and produces its result.
+    Every fetch in this module goes through here.
+    '''
+    return instruments.call_backend(backend_limiter.call, fetch, *args)
+
+def fetch_courses(user_token: str) -> list:
+    '''
+    Consumes a user_token and produces the user's courses, only
+    calling get_courses when they are not already in fetch_cache.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    Returns: a list of the user's courses
+    '''
+    return fetch_cache.get(user_token, None, lambda: call_backend(backend.get_courses, user_token))
+
+def fetch_submissions(user_token: str, course_id: int) -> list:
+    '''
+    Consumes a user_token and a course_id and produces the user's
+    submissions in that course, only calling get_submissions when
+    they are not already in fetch_cache.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a list of the user's submissions in the course
+    '''
+    return fetch_cache.get(user_token, course_id,
+                           lambda: compact_submissions(call_backend(
+                               backend.get_submissions, user_token, course_id)))
+
+def _intern(value):
+    '''
+    Produces the interned copy of a string, so that equal strings
+    share one object, and leaves anything else alone.
+    '''
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+class GroupRecord:
+    '''
+    A compact, read-only assignment group, shared by every
+    assignment (of every student) in the same group.
+    '''
+    __slots__ = ('name', 'weight', '__weakref__')
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+
+class AssignmentRecord:
+    '''
+    A compact, read-only assignment, shared by the submissions
+    of every student to the same assignment.
+    '''
+    __slots__ = ('id', 'name', 'module', 'points_possible', 'due_at', 'group', '__weakref__')
+
+    def __init__(self, id: int, name: str, module: str, points_possible,
+                 due_at: str, group: GroupRecord):
+        self.id = id
+        self.name = name
+        self.module = module
+        self.points_possible = points_possible
+        self.due_at = due_at
+        self.group = group
+
+class SubmissionRecord:
+    '''
+    A compact submission, with the same attributes as the backend's
+    but no per-instance dictionary. Comments are kept as a tuple.
+    '''
+    __slots__ = ('assignment', 'score', 'grade', 'status', 'comments',
+                 'submitted_at', 'graded_at')
+
+    def __init__(self, assignment: AssignmentRecord, score, grade: str, status: str,
+                 comments: tuple, submitted_at: str, graded_at: str):
+        self.assignment = assignment
+        self.score = score
+        self.grade = grade
+        self.status = status
+        self.comments = comments
+        self.submitted_at = submitted_at
+        self.graded_at = graded_at
+
+# Every GroupRecord and AssignmentRecord still in use, by their fields,
+# so that equal ones from different fetches are the same object
+_shared_records = weakref.WeakValueDictionary()
+_shared_lock = threading.Lock()
+
+def _shared(record_type, *fields):
+    '''
+    Produces the record_type made of the given fields, reusing
+    the one already in use if there is one.
+    '''
+    key = (record_type,) + fields
+    with _shared_lock:
+        record = _shared_records.get(key)
+        if record is None:
+            record = record_type(*fields)
+            _shared_records[key] = record
+        return record
+
+def compact_submissions(submissions: list) -> list:
+    '''
+    Converts a backend's submissions into SubmissionRecords, whose
+    group names, module names, grades and statuses are interned and
+    whose AssignmentRecords and GroupRecords are shared with every
+    other submission to the same assignment, so that many students'
+    submissions to one course take little more memory than one's.
+
+    Consumes:
+    1. submissions (list): the submissions from get_submissions
+    Returns: a list of SubmissionRecords, in the same order
+    '''
+    # For this call only: id(backend assignment) -> AssignmentRecord,
+    # id(backend group) -> GroupRecord and grade or status -> its
+    # interned copy, since a course only has a handful of each
+    converted = {}
+    groups = {}
+    interned = {}
+    records = []
+    for submission in submissions:
+        assignment = submission.assignment
+        record = converted.get(id(assignment))
+        if record is None:
+            group = assignment.group
+            group_record = groups.get(id(group))
+            if group_record is None:
+                group_record = _shared(GroupRecord, _intern(group.name), group.weight)
+                groups[id(group)] = group_record
+            record = _shared(AssignmentRecord, assignment.id, assignment.name,
+                             _intern(assignment.module), assignment.points_possible,
+                             _intern(assignment.due_at), group_record)
+            converted[id(assignment)] = record
+        grade = submission.grade
+        try:
+            grade = interned[grade]
+        except KeyError:
+            grade = interned[grade] = _intern(grade)
+        status = submission.status
+        try:
+            status = interned[status]
+        except KeyError:
+            status = interned[status] = _intern(status)
+        comments = tuple(submission.comments) if submission.comments else ()
+        records.append(SubmissionRecord(record, submission.score, grade, status, comments,
+                                        submission.submitted_at, submission.graded_at))
+    return records
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(timestamp: str) -> datetime:
+    '''
+    Parses a Canvas timestamp (like "2017-01-23T10:00:00+0000") into
+    a timezone-aware datetime. Each distinct string is only parsed
+    once per session; fromisoformat is tried first since it is much
+    faster than strptime, which is kept for anything it rejects.
+    
+    Consumes:
+    1. timestamp (str): an ISO 8601 timestamp with a UTC offset
+    Returns: a datetime for that moment
+    '''
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S%z")
+
+_OFFSET = re.compile(r'([+-])(\d\d):?(\d\d)')
+
+def _offset_seconds(offset: str) -> int:
+    '''
+    Produces the number of seconds east of UTC described by the end
+    of a timestamp ("Z", "+0000", "-05:00" or nothing at all).
+    '''
+    if offset in ('', 'Z'):
+        return 0
+    match = _OFFSET.fullmatch(offset)
+    if match is None:
+        raise ValueError('not a UTC offset: ' + offset)
+    seconds = int(match.group(2)) * 3600 + int(match.group(3)) * 60
+    if match.group(1) == '-':
+        return -seconds
+    return seconds
+
+def parse_timestamps(timestamps: list):
+    '''
+    Parses a whole list of Canvas timestamps at once into a numpy
+    array of UTC datetime64 values, with NaT wherever a timestamp is
+    missing. The date and time are converted by numpy in one call,
+    and each distinct UTC offset is only parsed once.
+    
+    Consumes:
+    1. timestamps (list): strings like "2017-01-23T10:00:00+0000",
+                          or None
+    Returns: a datetime64[s] array the same length as timestamps
+    '''
+    parsed = np.full(len(timestamps), np.datetime64('NaT'), dtype='datetime64[s]')
+    present = [index for index, timestamp in enumerate(timestamps) if timestamp]
+    if not present:
+        return parsed
+    texts = [timestamps[index] for index in present]
+    try:
+        # Casting to U19 keeps just "YYYY-MM-DDTHH:MM:SS"
+        local = np.array(texts).astype('U19').astype('datetime64[s]')
+        offsets, which = np.unique([text[19:] for text in texts], return_inverse=True)
+        seconds = np.array([_offset_seconds(offset) for offset in offsets], dtype=np.int64)
+    except ValueError:
+        # Not the usual Canvas format, so parse them one at a time
+        for index, text in zip(present, texts):
+            utc = parse_timestamp(text).astimezone(timezone.utc).replace(tzinfo=None)
+            parsed[index] = np.datetime64(utc, 's')
+        return parsed
+    parsed[present] = local - seconds[which].astype('timedelta64[s]')
+    return parsed
+
+# Column getters for SubmissionFrame, applied with map() so that
+# walking the submissions stays in C
+_ASSIGNMENT_ID = operator.attrgetter('assignment.id')
+_POINTS_POSSIBLE = operator.attrgetter('assignment.points_possible')
+_WEIGHT = operator.attrgetter('assignment.group.weight')
+_GROUP_NAME = operator.attrgetter('assignment.group.name')
+_DUE_AT = operator.attrgetter('assignment.due_at')
+_SCORE = operator.attrgetter('score')
+_COMMENTS = operator.attrgetter('comments')
+_STATUS = operator.attrgetter('status')
+_GRADE = operator.attrgetter('grade')
+_SUBMITTED_AT = operator.attrgetter('submitted_at')
+_GRADED_AT = operator.attrgetter('graded_at')
+
+
+class SubmissionFrame:
+    '''
+    A columnar copy of a list of submissions, with one numpy array
+    per field so that statistics can be computed with vectorized
+    operations instead of walking Submission objects.
+    
+    Columns:
+    - assignment_id, points_possible, score (NaN when there is no score),
+      weight (the assignment group's weight) and comments (how many)
+    - group_id: an index into group_names, where groups whose names
+      only differ by case share an id
+    - graded (status is 'graded'), has_grade (grade is set) and
+      has_graded_at (graded_at is set) masks
+    - submitted_at, due_at and graded_at as UTC datetime64 (NaT if missing),
+      parsed the first time they are read
+    
+    Consumes:
+    1. submissions (list): the submissions of one course
+    '''
+    def __init__(self, submissions: list):
+        # The timestamp columns are parsed on first use, so keep the rows
+        self._submissions = submissions
+        count = len(submissions)
+        
+        # lowercased group name -> group id, in order of first appearance
+        group_ids = {}
+        self.group_names = []
+        names = list(map(_GROUP_NAME, submissions))
+        name_ids = {}
+        for name in dict.fromkeys(names):
+            key = name.lower()
+            if key not in group_ids:
+                group_ids[key] = len(self.group_names)
+                self.group_names.append(name)
+            name_ids[name] = group_ids[key]
+        self.group_ids = group_ids
+        self.group_id = np.fromiter(map(name_ids.__getitem__, names),
+                                    dtype=np.int64, count=count)
+        
+        self.assignment_id = np.fromiter(map(_ASSIGNMENT_ID, submissions),
+                                         dtype=np.int64, count=count)
+        # Keep integer points as integers, so totals print like they used to
+        if submissions:
+            self.points_possible = np.array(list(map(_POINTS_POSSIBLE, submissions)))
+        else:
+            self.points_possible = np.zeros(0, dtype=np.int64)
+        # None becomes NaN when converted to floats
+        self.score = np.array(list(map(_SCORE, submissions)), dtype=np.float64)
+        self.weight = np.fromiter(map(_WEIGHT, submissions),
+                                  dtype=np.float64, count=count)
+        self.comments = np.fromiter([len(comments) if comments else 0
+                                     for comments in map(_COMMENTS, submissions)],
+                                    dtype=np.int64, count=count)
+        self.graded = np.fromiter(map(operator.eq, map(_STATUS, submissions),
+                                      itertools.repeat('graded')),
+                                  dtype=bool, count=count)
+        self.has_grade = np.fromiter(map(bool, map(_GRADE, submissions)),
+                                     dtype=bool, count=count)
+        self.has_graded_at = np.fromiter(map(bool, map(_GRADED_AT, submissions)),
+                                         dtype=bool, count=count)
+    
+    @cached_property
+    def submitted_at(self):
+        return parse_timestamps(list(map(_SUBMITTED_AT, self._submissions)))
+    
+    @cached_property
+    def due_at(self):
+        return parse_timestamps(list(map(_DUE_AT, self._submissions)))
+    
+    @cached_property
+    def graded_at(self):
+        return parse_timestamps(list(map(_GRADED_AT, self._submissions)))
+    
+    def __len__(self) -> int:
+        return len(self.assignment_id)
+    
+    def score_percentages(self):
+        '''
+        Produces an array of the percentage scored on every
+        submission that has a grade and is worth any points.
+        '''
+        mask = self.has_grade & (self.points_possible > 0)
+        return self.score[mask] / self.points_possible[mask] * 100
+    
+    def earliness_days(self):
+        '''
+        Produces an array of how many whole days before its due date
+        each submission was submitted (negative when late, rounded
+        down like days_apart), for submissions with both dates.
+        '''
+        mask = ~np.isnat(self.submitted_at) & ~np.isnat(self.due_at)
+        seconds = (self.due_at[mask] - self.submitted_at[mask]).astype(np.int64)
+        return seconds // 86400
+    
+    def lateness_days(self):
+        '''
+        Produces an array of how many days (with fractions) after its
+        due date each submission was submitted (negative when early),
+        for submissions with both dates.
+        '''
+        mask = ~np.isnat(self.submitted_at) & ~np.isnat(self.due_at)
+        seconds = (self.submitted_at[mask] - self.due_at[mask]).astype(np.int64)
+        return seconds / 86400
+    
+    def total_weighted(self) -> float:
+        '''
+        Produces the sum of every assignment's points possible
+        multiplied by its group weight, as a percentage.
+        '''
+        return float(np.sum(self.points_possible * self.weight)) / 100
+
+def course_frame(user_token: str, course_id: int) -> SubmissionFrame:
+    '''
+    Consumes a user_token and a course_id and produces the
+    SubmissionFrame of the user's submissions in that course,
+    built once per fetch and kept alongside the cached submissions.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a SubmissionFrame of the course
+    '''
+    return submission_frame(user_token, course_id, fetch_submissions(user_token, course_id))
+
+def submission_frame(user_token: str, course_id: int, submissions: list) -> SubmissionFrame:
+    '''
+    Produces the SubmissionFrame of submissions, the user's fetched
+    submissions in the course, built once per fetch.
+    '''
+    return fetch_cache.derive(user_token, course_id, 'frame', submissions,
+                              lambda: SubmissionFrame(submissions))
+
+class GroupBucket:
+    '''
+    The running totals of one assignment group in a CourseSummary:
+    its name, points earned and possible on graded submissions,
+    graded and total submissions, and weight (that of the group's
+    first assignment).
+    '''
+    __slots__ = ('name', 'earned', 'possible', 'graded', 'submissions', 'weight')
+
+    def __init__(self, name: str, earned: float, possible: float, graded: int,
+                 submissions: int, weight: float):
+        self.name = name
+        self.earned = earned
+        self.possible = possible
+        self.graded = graded
+        self.submissions = submissions
+        self.weight = weight
+    
+    def copy(self) -> 'GroupBucket':
+        '''
+        Produces a new bucket with the same totals.
+        '''
+        return GroupBucket(self.name, self.earned, self.possible, self.graded,
+                           self.submissions, self.weight)
+    
+    def add(self, other: 'GroupBucket'):
+        '''
+        Adds another bucket of the same group's totals into this one.
+        '''
+        self.earned += other.earned
+        self.possible += other.possible
+        self.graded += other.graded
+        self.submissions += other.submissions
+
+class CourseSummary:
+    '''
+    Every statistic about a course's submissions, computed with
+    vectorized reductions over its SubmissionFrame: total points
+    possible, comment count, graded/ungraded counts, the unweighted
+    and weighted averages, and the unweighted average, weight and
+    graded/total counts of every assignment group.
+    
+    Consumes:
+    1. frame (SubmissionFrame): the submissions of one course
+    '''
+    def __init__(self, frame: SubmissionFrame):
+        graded = frame.graded
+        earned = np.where(graded, frame.score, 0.0)
+        possible = np.where(graded, frame.points_possible, 0)
+        
+        self.total_points = frame.points_possible.sum().item()
+        self.comments = int(frame.comments.sum())
+        self.graded = int(graded.sum())
+        self.ungraded = len(frame) - self.graded
+        self.points_earned = float(earned.sum())
+        self.points_possible = float(possible.sum())
+        self.weighted_earned = float(np.sum(earned * frame.weight))
+        self.weighted_possible = float(np.sum(possible * frame.weight))
+        
+        # lowercased group name -> GroupBucket
+        group_count = len(frame.group_names)
+        group_earned = np.bincount(frame.group_id, weights=earned, minlength=group_count)
+        group_possible = np.bincount(frame.group_id, weights=possible, minlength=group_count)
+        group_graded = np.bincount(frame.group_id, weights=graded, minlength=group_count)
+        group_size = np.bincount(frame.group_id, minlength=group_count)
+        # The weight of each group's first assignment
+        present, first = np.unique(frame.group_id, return_index=True)
+        weights = dict(zip(present.tolist(), frame.weight[first].tolist()))
+        self.groups = {}
+        for key, index in frame.group_ids.items():
+            self.groups[key] = GroupBucket(frame.group_names[index],
+                                           float(group_earned[index]),
+                                           float(group_possible[index]),
+                                           int(group_graded[index]),
+                                           int(group_size[index]),
+                                           float(weights.get(index, 0.0)))
+    
+    def ratio_graded(self) -> str:
+        '''
+        Produces a string comparing the number of graded
+        submissions to the number of submissions.
+        '''
+        return str(self.graded) + '/' + str(self.graded + self.ungraded)
+    
+    def average_score(self) -> float:
+        '''
+        Produces the average, unweighted score of the
+        graded submissions, or 0.0 if nothing is graded.
+        '''
+        if self.points_possible == 0:
+            return 0.0
+        return self.points_earned / self.points_possible
+    
+    def average_weighted(self) -> float:
+        '''
+        Produces the average, weighted score of the
+        graded submissions, or 0.0 if nothing is graded.
+        '''
+        if self.weighted_possible == 0:
+            return 0.0
+        return self.weighted_earned / self.weighted_possible
+    
+    def average_group(self, group_name: str) -> float:
+        '''
+        Produces the average, unweighted score of the graded
+        submissions in the group called group_name (ignoring
+        case), or 0.0 if none of them are graded.
+        '''
+        group = self.groups.get(group_name.lower())
+        if group is None or group.possible == 0:
+            return 0.0
+        return group.earned / group.possible
+    
+    def group_breakdown(self) -> list:
+        '''
+        Produces a dictionary for every assignment group, in the
+        order they first appear, with its name, weight, graded
+        and total submissions and unweighted average.
+        '''
+        return [{'name': group.name, 'weight': group.weight, 'graded': group.graded,
+                 'submissions': group.submissions, 'average': self.average_group(key)}
+                for key, group in self.groups.items()]
+    
+    def as_dict(self) -> dict:
+        '''
+        Produces a dictionary of every statistic, with the
+        average of each group under its name in 'groups'.
+        '''
+        return {'total_points': self.total_points,
+                'comments': self.comments,
+                'graded': self.graded,
+                'ungraded': self.ungraded,
+                'average_score': self.average_score(),
+                'average_weighted': self.average_weighted(),
+                'groups': {self.groups[key].name: self.average_group(key)
+                           for key in self.groups}}
+    
+    def merge(self, other: 'CourseSummary'):
+        '''
+        Adds the statistics of another part of the same course's
+        submissions into this summary, as if both parts had been
+        summarized together.
+        '''
+        self.total_points += other.total_points
+        self.comments += other.comments
+        self.graded += other.graded
+        self.ungraded += other.ungraded
+        self.points_earned += other.points_earned
+        self.points_possible += other.points_possible
+        self.weighted_earned += other.weighted_earned
+        self.weighted_possible += other.weighted_possible
+        for key, group in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = group.copy()
+            else:
+                self.groups[key].add(group)
+
+def course_summary(user_token: str, course_id: int) -> CourseSummary:
+    '''
+    Consumes a user_token and a course_id and produces the
+    CourseSummary of the user's submissions in that course. The
+    summary is kept alongside the cached submissions, so it is
+    only computed once per fetch.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a CourseSummary of the course
+    '''
+    submissions = fetch_submissions(user_token, course_id)
+    return fetch_cache.derive(user_token, course_id, 'summary', submissions,
+                              lambda: CourseSummary(
+                                  submission_frame(user_token, course_id, submissions)))
+
+def _fetch_page(user_token: str, course_id: int, page: int, page_size: int) -> list:
+    '''
+    Fetches one page of a user's submissions in a course
+    from the backend's get_submissions_page.
+    '''
+    return call_backend(backend.get_submissions_page, user_token, course_id, page, page_size)
+
+def _slice_pages(user_token: str, course_id: int, page_size: int):
+    '''
+    Yields pages sliced from the user's whole list of submissions in
+    a course, for backends without get_submissions_page. The cached
+    list is used if there is one; otherwise the list is fetched
+    without caching it, so it is let go once the pages are.
+    '''
+    found, submissions = fetch_cache.lookup(user_token, course_id)
+    if not found:
+        submissions = call_backend(backend.get_submissions, user_token, course_id)
+    for start in range(0, len(submissions), page_size):
+        yield submissions[start:start + page_size]
+
+def iter_submissions(user_token: str, course_id: int, page_size: int = 500,
+                     prefetch: bool = True):
+    '''
+    Consumes a user_token and a course_id and yields the user's
+    submissions in that course one page at a time.
+    
+    Backends can serve pages directly with a
+    get_submissions_page(user_token, course_id, page, page_size)
+    function that produces the page's submissions (fewer than
+    page_size on the last page). Then no more than two pages are
+    held at once: while a page is being used, the next one is
+    fetched on a background thread (unless prefetch is False).
+    For backends without one the whole list is fetched once (or
+    taken from fetch_cache) and sliced, so it is all in memory
+    until the last page has been used, though it is not cached.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    3. page_size (int): how many submissions each page has
+    4. prefetch (bool): whether to fetch the next page in the background
+    Returns: a generator of lists of submissions, one per page
+    '''
+    if getattr(backend, 'get_submissions_page', None) is None:
+        yield from _slice_pages(user_token, course_id, page_size)
+        return
+    if not prefetch:
+        page = 0
+        while True:
+            submissions = _fetch_page(user_token, course_id, page, page_size)
+            if submissions:
+                yield submissions
+            if len(submissions) < page_size:
+                return
+            page += 1
+    
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = 0
+        upcoming = pool.submit(_fetch_page, user_token, course_id, page, page_size)
+        while upcoming is not None:
+            submissions = upcoming.result()
+            upcoming = None
+            if len(submissions) == page_size:
+                page += 1
+                upcoming = pool.submit(_fetch_page, user_token, course_id, page, page_size)
+            if submissions:
+                yield submissions
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def stream_summary(user_token: str, course_id: int, page_size: int = 500,
+                   prefetch: bool = True) -> CourseSummary:
+    '''
+    Consumes a user_token and a course_id and produces the same
+    CourseSummary as course_summary (so total_points, comments, the
+    graded ratio and the averages), in one pass over iter_submissions.
+    Nothing is cached, and with a backend that has
+    get_submissions_page only a page or two of submissions are held
+    at once, so use this for courses too large to keep in memory
+    (see iter_submissions for backends without one).
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    3. page_size (int): how many submissions to read at a time
+    4. prefetch (bool): whether to fetch the next page in the background
+    Returns: a CourseSummary of the course
+    '''
+    summary = CourseSummary(SubmissionFrame([]))
+    for submissions in iter_submissions(user_token, course_id, page_size, prefetch):
+        summary.merge(CourseSummary(SubmissionFrame(submissions)))
+    return summary
+
+class CourseIndex:
+    '''
+    Hash indexes over a user's courses, so that a course can be
+    found without scanning the list.
+    
+    - by_id: course id -> course (the last course with that id wins,
+      like the scan in find_course)
+    - by_code_prefix: every prefix of every course code -> the first
+      course whose code starts with it
+    
+    Consumes:
+    1. courses (list): the user's courses
+    '''
+    def __init__(self, courses: list):
+        self.by_id = {}
+        self.by_code_prefix = {}
+        for course in courses:
+            self.by_id[course.id] = course
+            code = str(course.code)
+            for end in range(1, len(code) + 1):
+                self.by_code_prefix.setdefault(code[:end], course)
+
+def course_index(user_token: str) -> CourseIndex:
+    '''
+    Consumes a user_token and produces the CourseIndex of the
+    user's courses, built once per fetch of the courses.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    Returns: a CourseIndex of the user's courses
+    '''
+    courses = fetch_courses(user_token)
+    return fetch_cache.derive(user_token, None, 'index', courses,
+                              lambda: CourseIndex(courses))
+
+def assignment_index(user_token: str, course_id: int) -> dict:
+    '''
+    Consumes a user_token and a course_id and produces a dictionary
+    from assignment id to the user's submission for it, built once
+    per fetch of the course's submissions. If an assignment has
+    more than one submission, the last one wins.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a dictionary from assignment id to submission
+    '''
+    submissions = fetch_submissions(user_token, course_id)
+    return fetch_cache.derive(user_token, course_id, 'index', submissions,
+                              lambda: {submission.assignment.id: submission
+                                       for submission in submissions})
+
 def count_courses(user_token: str) -> int:
     '''
     Consumes a user_token (a string value)
@@ -33,14 +1245,9 @@ def count_courses(user_token: str) -> int:
     Returns: an integer representing the number
     of courses a student is taking.
     '''
-    courses = get_courses(user_token)
+    courses = fetch_courses(user_token)
     return len(courses)
 
-assert_equal(count_courses('annie'), 6)
-assert_equal(count_courses('jeff'), 6)
-assert_equal(count_courses('pierce'), 0)
-assert_equal(count_courses('troy'), 1)
-
 def find_cs1(user_token: str) -> int:
     '''
     Consumes a user_token(a string) and produces an integer 
@@ -54,18 +1261,10 @@ def find_cs1(user_token: str) -> int:
     Returns: an integer representing the ID of the course
     that has "CISC1" in their code field
     '''
-    courses = get_courses(user_token)
-    id = 0
-    for course in courses:
-        if 'CISC1' in course.code:
-            id = course.id
-            break
-    return id
-
-assert_equal(find_cs1('annie'), 100167)
-assert_equal(find_cs1('jeff'), 100167)
-assert_equal(find_cs1('pierce'), 0)
-assert_equal(find_cs1('troy'), 0)
+    course = course_index(user_token).by_code_prefix.get('CISC1')
+    if course is None:
+        return 0
+    return course.id
 
 def find_course(user_token: str, course_id: int) -> str:
     '''
@@ -83,17 +1282,30 @@ def find_course(user_token: str, course_id: int) -> str:
     with the given ID
     
     '''
-    courses = get_courses(user_token)
-    found = 'no course found'
-    
-    for course in courses:
-        if course_id == course.id:
-            found = course.name
-    return found
+    course = course_index(user_token).by_id.get(course_id)
+    if course is None:
+        return 'no course found'
+    return course.name
 
-assert_equal(find_course('annie', 394382), 'History of Ice Cream')
-assert_equal(find_course('jeff', 600), 'no course found')
-assert_equal(find_course('abed', 134088), 'Physical Education Education')
+def format_course(course) -> str:
+    '''
+    Produces the line describing a course in render_courses:
+    its ID and code, ending with a newline.
+    '''
+    return str(course.id) +': ' + str(course.code) + '\n'
+
+def stream_courses(user_token: str):
+    '''
+    consumes a user_token (a string) and yields the line describing
+    each of the user's courses, as render_courses would join them.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier 
+    Returns: a generator of one line per course
+    '''
+    for course in fetch_courses(user_token):
+        yield format_course(course)
 
 def render_courses (user_token: str) -> str:
     '''
@@ -109,16 +1321,52 @@ def render_courses (user_token: str) -> str:
     courses by joining together their IDs and codes,
     ending each course with a newline.
     '''
-    courses = get_courses(user_token)
-    available_courses = ''
+    return ''.join(stream_courses(user_token))
+
+def format_report(summary: CourseSummary) -> str:
+    '''
+    Produces the end of a report_all line from a course's summary:
+    total points, graded ratio and weighted average.
+    '''
+    return (str(summary.total_points) + ' points | ' +
+            summary.ratio_graded() + ' graded | ' +
+            str(round(summary.average_weighted(), 4)) + ' weighted\n')
+
+def report_all(user_token: str, max_workers: int = 8, timeout: float = 30.0) -> str:
+    '''
+    consumes a user_token (a string) and produces a table with one
+    line per course: its ID and code, the total points, the ratio
+    of graded assignments and the average weighted score. The
+    submissions of every course are fetched at the same time, so
+    the table takes about as long as the slowest course.
     
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. max_workers (int): how many courses to fetch at once
+    3. timeout (float): how many seconds to wait for all of the
+                        courses before giving up on the rest
+    Returns: a string with a line for each of the user's courses
+    '''
+    courses = fetch_courses(user_token)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    fetches = {}
     for course in courses:
-        available_courses += str(course.id) +': ' + str(course.code) + '\n'  
-    return available_courses
-
-assert_equal(render_courses('annie'), '679554: MATH101\n386814: ENGL101\n4182: SPAN101\n394382: ICRM304\n100167: CISC1\n134088: PHED201\n')
-assert_equal(render_courses('troy'), '394382: ICRM304')
-assert_equal(render_courses('pierce'), '')
+        fetches[course.id] = pool.submit(fetch_submissions, user_token, course.id)
+    wait(fetches.values(), timeout=timeout)
+    pool.shutdown(wait=False, cancel_futures=True)
+    
+    table = ''
+    for course in courses:
+        fetch = fetches[course.id]
+        table += str(course.id) + ': ' + str(course.code) + ' | '
+        if not fetch.done():
+            table += 'timed out\n'
+        elif fetch.exception() is not None:
+            table += 'could not be fetched\n'
+        else:
+            table += format_report(course_summary(user_token, course.id))
+    return table
 
 def total_points(user_token: str, course_id: int) -> int:
     '''
@@ -134,20 +1382,7 @@ def total_points(user_token: str, course_id: int) -> int:
     Returns: an integer representing the total number
     of points available in the course
     '''
-    total = 0
-    submissions = get_submissions(user_token, course_id)
-    
-    for submission in submissions:
-        total += submission.assignment.points_possible
-        
-    return total
-
-assert_equal(total_points('annie', 679554), 420)
-assert_equal(total_points('annie', 386814), 700)
-assert_equal(total_points('annie', 100167), 1060)
-assert_equal(total_points('jeff', 679554), 420)
-assert_equal(total_points('jeff', 386814), 700)
-assert_equal(total_points('troy', 394382), 100)
+    return course_summary(user_token, course_id).total_points
 
 def count_comments(user_token: str, course_id: int) -> int:
     '''
@@ -163,16 +1398,7 @@ def count_comments(user_token: str, course_id: int) -> int:
     Returns: an integer representing the total number
     of comments in the course
     '''
-    submissions = get_submissions(user_token, course_id)
-    total = 0
-    for submission in submissions:
-        if submission.comments:
-            total += len(submission.comments)
-            
-    return total
-
-assert_equal(count_comments('annie', 679554), 14)
-assert_equal(count_comments('troy', 394382), 0)
+    return course_summary(user_token, course_id).comments
 
 def ratio_graded(user_token: str, course_id: int) -> str:
     '''
@@ -189,19 +1415,7 @@ def ratio_graded(user_token: str, course_id: int) -> str:
     Returns: a string representing the ratio of
     assignmnets that have been graded vs ungraded
     '''
-    submissions = get_submissions(user_token, course_id)
-    denominator = len(submissions)
-    
-    numerator = 0
-    for submission in submissions:
-        if submission.status == 'graded':
-            numerator += 1
-            
-    return (str(numerator) + '/' + str(denominator))
-
-assert_equal(ratio_graded('annie', 679554), '10/10')
-assert_equal(ratio_graded('annie', 134088), '6/11')
-assert_equal(ratio_graded('shirley', 134088), '7/11')
+    return course_summary(user_token, course_id).ratio_graded()
 
 def average_score (user_token: str, course_id: int) -> float:
     '''
@@ -217,21 +1431,7 @@ def average_score (user_token: str, course_id: int) -> float:
     Returns: a float representing the average, unweighted score
     of all graded assignments in the course
     '''
-    
-    points_possible = 0.0
-    points_earned = 0.0
-    submissions = get_submissions(user_token, course_id)
-    
-    for submission in submissions:
-        if submission.status == 'graded':
-            points_earned += submission.score 
-            points_possible += submission.assignment.points_possible
-    
-    return points_earned/points_possible
-
-assert_equal(average_score('annie', 679554), 0.95)
-assert_equal(average_score('annie', 386814), 0.97)
-assert_equal(average_score('jeff', 386814), 0.7)
+    return course_summary(user_token, course_id).average_score()
 
 def average_weighted (user_token: str, course_id: int) -> float:
     '''
@@ -247,19 +1447,7 @@ def average_weighted (user_token: str, course_id: int) -> float:
     Returns: a float representing the average, weighted score
     of all graded assignments in the course
     '''
-    submissions = get_submissions(user_token, course_id)
-    score_sum = 0
-    points_possible = 0
-    for submission in submissions:
-        if submission.status == 'graded':
-            score_sum += submission.score * submission.assignment.group.weight
-            points_possible += submission.assignment.points_possible * submission.assignment.group.weight
-    
-    return score_sum/points_possible
-
-assert_equal (average_weighted('annie', 679554), 0.9471153846153846)
-assert_equal (average_weighted('annie', 386814), 0.97)
-assert_equal (average_weighted('jeff', 386814), 0.7)
+    return course_summary(user_token, course_id).average_weighted()
 
 def average_group (user_token: str, course_id: int, group_name: str) -> float:
     '''
@@ -278,22 +1466,79 @@ def average_group (user_token: str, course_id: int, group_name: str) -> float:
     Returns: a float representing the average, unweighted
     grade ratio of all assignments with that group_name
     '''
-    submissions = get_submissions(user_token, course_id)
-    
-    total_score = 0
-    points_earned = 0
+    return course_summary(user_token, course_id).average_group(group_name)
+
+def format_summary(summary: CourseSummary) -> str:
+    '''
+    Produces the string render_summary prints for a CourseSummary.
+    '''
+    printed = ('Points: ' + str(summary.total_points) +
+               '\nComments: ' + str(summary.comments) +
+               '\nGraded: ' + summary.ratio_graded() +
+               '\nScore (unweighted): ' + str(summary.average_score()) +
+               '\nScore (weighted): ' + str(summary.average_weighted()))
+    for key in summary.groups:
+        printed += '\nGroup ' + summary.groups[key].name + ': ' + str(summary.average_group(key))
+    return printed
+
+def format_groups(summary: CourseSummary) -> str:
+    '''
+    Produces the string render_groups prints for a CourseSummary:
+    one line per assignment group.
+    '''
+    printed = ''
+    for group in summary.group_breakdown():
+        printed += (group['name'] + ' | weight ' + str(round(group['weight'], 2)) +
+                    ' | ' + str(group['graded']) + '/' + str(group['submissions']) +
+                    ' graded | ' + str(round(group['average'], 4)) + '\n')
+    return printed
+
+def render_groups(user_token: str, course_id: int) -> str:
+    '''
+    consumes a user_token (a string) and a course_id (an integer)
+    and produces a table with a line for every assignment group in
+    the course: its name, weight, graded ratio and unweighted
+    average. Every group comes from the same cached CourseSummary,
+    so this costs no more than a single average_group.
     
-    for submission in submissions:
-        if group_name.lower() == submission.assignment.group.name.lower():
-            if submission.status == 'graded':
-                total_score += submission.assignment.points_possible
-                points_earned += submission.score 
-            
-    if total_score == 0.0:
-        return 0.0
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a string with a line for each assignment group
+    '''
+    return format_groups(course_summary(user_token, course_id))
+
+def render_summary(user_token: str, course_id: int) -> str:
+    '''
+    consumes a user_token (a string) and a course_id (an integer),
+    and produces a string with every statistic about the course:
+    total points, comments, graded ratio, the unweighted and
+    weighted averages and the average of each assignment group,
+    each on its own line.
     
-assert_equal(average_group('annie', 679554, 'Homework'), 0.9636363636363636)
-assert_equal(average_group('troy', 394382, 'Assignments'), 0.8)
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a string summarizing the course
+    '''
+    return format_summary(course_summary(user_token, course_id))
+
+def format_assignment(submission) -> str:
+    '''
+    Produces the string render_assignment prints for a submission:
+    the assignment's ID, name, group and module, and its grade.
+    '''
+    printed = str(submission.assignment.id) + ": " + submission.assignment.name + "\nGroup: " + submission.assignment.group.name + "\nModule: " + submission.assignment.module + "\nGrade: "  
+    if submission.status == "graded":
+        g = str(submission.score) + "/" + str(submission.assignment.points_possible) + " (" + submission.grade + ")"
+        printed += g
+    else:
+        printed += "(missing)"
+    return printed
 
 def render_assignment(user_token: str, course_id: int, assignment_id: int) -> str:
     '''
@@ -312,26 +1557,58 @@ def render_assignment(user_token: str, course_id: int, assignment_id: int) -> st
     Returns: a string representing an assignment
     and its submission details
     '''
-    submissions = get_submissions(user_token, course_id)
-    
-    printed = "Assignment not found: " + str(assignment_id)
+    submission = assignment_index(user_token, course_id).get(assignment_id)
+    if submission is None:
+        return "Assignment not found: " + str(assignment_id)
+    return format_assignment(submission)
+
+def format_submission(submission) -> str:
+    '''
+    Produces the line describing a submission in render_all: its
+    assignment's ID and name and whether it was graded.
+    '''
+    if submission.grade:
+        return str(submission.assignment.id) + ": " + submission.assignment.name + " (Graded)\n"
+    return str(submission.assignment.id) + ": " + submission.assignment.name + " (Ungraded)\n"
+
+def stream_all(user_token: str, course_id: int):
+    '''
+    consumes a user_token (a string) and a course_id (an integer)
+    and yields the line describing each submission in the course,
+    as render_all would join them.
     
-    for submission in submissions:
-        if submission.assignment.id == assignment_id:
-            printed = str(submission.assignment.id) + ": " + submission.assignment.name + "\nGroup: " + submission.assignment.group.name + "\nModule: " + submission.assignment.module + "\nGrade: "  
-            if submission.status == "graded":
-                g = str(submission.score) + "/" + str(submission.assignment.points_possible) + " (" + submission.grade + ")"
-                printed += g
-            else:
-                printed += "(missing)"
-    return printed
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    Returns: a generator of one line per submission
+    '''
+    for submission in fetch_submissions(user_token, course_id):
+        yield format_submission(submission)
 
-assert_equal(render_assignment('annie', 679554, 7), 'Assignment not found: 7')
-assert_equal(render_assignment('annie', 679554, 299650), '299650: Introduction\nGroup: Homework\nModule: Module 1\nGrade: 10.0/10 (A)')
-assert_equal(render_assignment('annie', 679554, 553716), '553716: Basic Addition\nGroup: Homework\nModule: Module 2\nGrade: 14.0/15 (A)')
-assert_equal(render_assignment('annie', 679554, 805499), '805499: Basic Subtraction\nGroup: Homework\nModule: Module 2\nGrade: 19.0/20 (A)')
-assert_equal(render_assignment('annie', 134088, 937202), '937202: Technology in the outdoor classroom\nGroup: Homework\nModule: Module 2\nGrade: (missing)')
-assert_equal(render_assignment('jeff', 386814, 24048), '24048: HOMEWORK 3\nGroup: Assignments\nModule: MODULE 1\nGrade: 58.0/100 (F)')
+def write_stream(lines, sink, chunk_size: int = 256):
+    '''
+    Writes the lines from a generator (like stream_all) to a
+    file-like sink, chunk_size lines at a time, so that output
+    starts before the last line exists and only one chunk is
+    ever held in memory.
+    
+    Consumes:
+    1. lines: an iterable of strings
+    2. sink: anything with a write(str) method, like sys.stdout
+    3. chunk_size (int): how many lines to join per write
+    Returns: nothing
+    '''
+    with instruments.phase('render'):
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                sink.write(''.join(chunk))
+                chunk = []
+        if chunk:
+            sink.write(''.join(chunk))
 
 def render_all(user_token: str, course_id: int) -> str:
     '''
@@ -347,46 +1624,272 @@ def render_all(user_token: str, course_id: int) -> str:
     Returns: a string representing all submissions
     in the course
     '''
-    submissions = get_submissions(user_token, course_id)
-    string = ''
-    x = False
-    for submission in submissions:
-        if submission.grade:
-            string += (str(submission.assignment.id) + ": " + submission.assignment.name + " (Graded)\n")
-        else:
-            string += (str(submission.assignment.id) + ": " + submission.assignment.name + " (Ungraded)\n")
-    return string
+    return ''.join(stream_all(user_token, course_id))
+
+def export_submissions(user_token: str, course_id: int, path: str) -> int:
+    '''
+    consumes a user_token (a string), a course_id (an integer) and a
+    path, and writes one row per submission in the course to that
+    CSV, Parquet or Arrow file (see canvas_export).
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the ID
+                        of the course
+    3. path (str): the file to write, ending in .csv,
+                   .parquet or .arrow
+    Returns: the number of submissions written
+    '''
+    import canvas_export
+    return canvas_export.write_export([(user_token, course_id)], path)
+
+def _pyplot():
+    '''
+    Imports matplotlib.pyplot the first time something is plotted,
+    so that importing this module does not pay for it.
+    '''
+    import matplotlib.pyplot
+    return matplotlib.pyplot
+
+# When set (see save_plots), the plot commands write their charts to
+# files in this directory instead of showing them
+plot_directory = None
+plot_format = 'png'
 
-assert_equal(render_all('troy', 394382), '711675: Practical (graded)')
-assert_equal(render_all('shirley', 679554), '299650: Introduction (graded)\n553716: Basic Addition (graded)\n805499: Basic Subtraction (graded)\n749969: Basic Multiplication (graded)\n763866: Basic Division (graded)\n979025: Midterm 1 (graded)\n870878: Logarithms (graded)\n126393: Antiderivatives (graded)\n122494: Actual Sorcery (graded)\n683132: Final Exam (graded)\n')
+def save_plots(directory: str, format: str = 'png'):
+    '''
+    Switches matplotlib to the non-interactive Agg backend and makes the
+    plot commands save their charts as `format` files (png, svg, ...)
+    in the directory instead of opening windows, for headless servers.
+    '''
+    global plot_directory, plot_format
+    import matplotlib
+    matplotlib.use('Agg')
+    os.makedirs(directory, exist_ok=True)
+    plot_directory = directory
+    plot_format = format
+
+def plot_path(user_token: str, course_id: int, chart: str) -> str:
+    '''
+    Produces the file a chart of the course is saved to,
+    or None if charts are shown instead (see save_plots).
+    '''
+    if plot_directory is None:
+        return None
+    return os.path.join(plot_directory, str(user_token) + '_' + str(course_id) +
+                        '_' + chart + '.' + plot_format)
+
+@contextmanager
+def _drawing(path: str):
+    '''
+    Produces pyplot for drawing one chart, and clears the figure once
+    the chart has been saved to path, or if drawing it fails partway,
+    so that the next chart starts on a clean figure.
+    '''
+    plt = _pyplot()
+    try:
+        yield plt
+    except BaseException:
+        plt.clf()
+        raise
+    if path is not None:
+        plt.clf()
 
-def plot_scores(user_token: str, course_id: int):
+def _finish_plot(plt, path: str):
+    '''
+    Shows the current figure, or if a path is given saves it there
+    (in the format its extension names). Produces the path.
+    '''
+    if path is None:
+        plt.show()
+        return None
+    plt.savefig(path)
+    return path
+
+class ScoreSketch:
+    '''
+    A streaming histogram of score percentages, for looking at the
+    distribution across many users and courses without keeping every
+    score. Scores are counted into fixed bins of `width` percent from
+    `low` to `high`, with anything outside counted as below or above.
+    Sketches with the same bins can be merged, and they can be turned
+    into (and back from) JSON-friendly dictionaries.
+    
+    Quantiles are interpolated within their bin, so they are accurate
+    to within one bin width.
+    
+    Consumes:
+    1. low (float): the lowest percentage binned
+    2. high (float): the highest percentage binned
+    3. width (float): how many percent each bin covers
+    '''
+    def __init__(self, low: float = 0.0, high: float = 150.0, width: float = 1.0):
+        self.low = low
+        self.high = high
+        self.width = width
+        self.counts = np.zeros(int(round((high - low) / width)), dtype=np.int64)
+        self.below = 0
+        self.above = 0
+        self.count = 0
+        self.total = 0.0
+        self.smallest = None
+        self.largest = None
+    
+    def edges(self):
+        '''
+        Produces the edges of the bins, one more than there are bins.
+        '''
+        return self.low + np.arange(len(self.counts) + 1) * self.width
+    
+    def add(self, percentages):
+        '''
+        Counts an array (or list) of score percentages into the sketch.
+        '''
+        values = np.asarray(percentages, dtype=np.float64)
+        if len(values) == 0:
+            return
+        bins = np.floor((values - self.low) / self.width).astype(np.int64)
+        inside = (bins >= 0) & (bins < len(self.counts))
+        self.counts += np.bincount(bins[inside], minlength=len(self.counts))
+        self.below += int(np.sum(bins < 0))
+        self.above += int(np.sum(bins >= len(self.counts)))
+        self.count += len(values)
+        self.total += float(values.sum())
+        smallest = float(values.min())
+        largest = float(values.max())
+        self.smallest = smallest if self.smallest is None else min(self.smallest, smallest)
+        self.largest = largest if self.largest is None else max(self.largest, largest)
+    
+    def merge(self, other: 'ScoreSketch'):
+        '''
+        Adds another sketch's counts into this one. Raises ValueError
+        if the two do not have the same bins.
+        '''
+        if (self.low, self.high, self.width) != (other.low, other.high, other.width):
+            raise ValueError('can only merge sketches with the same bins')
+        self.counts += other.counts
+        self.below += other.below
+        self.above += other.above
+        self.count += other.count
+        self.total += other.total
+        for value in (other.smallest, other.largest):
+            if value is not None:
+                self.smallest = value if self.smallest is None else min(self.smallest, value)
+                self.largest = value if self.largest is None else max(self.largest, value)
+    
+    def mean(self) -> float:
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+    
+    def quantile(self, q: float) -> float:
+        '''
+        Produces the score percentage below which a fraction q of the
+        scores fall, or 0.0 if the sketch is empty.
+        '''
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        if rank <= self.below:
+            return float(self.smallest)
+        cumulative = self.below + np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, rank))
+        if index >= len(self.counts):
+            return float(self.largest)
+        before = cumulative[index] - self.counts[index]
+        within = (rank - before) / self.counts[index]
+        value = self.low + (index + within) * self.width
+        return float(min(max(value, self.smallest), self.largest))
+    
+    def percentiles(self) -> dict:
+        '''
+        Produces a dictionary of the count, mean, p50 and p90.
+        '''
+        return {'count': self.count, 'mean': self.mean(),
+                'p50': self.quantile(0.5), 'p90': self.quantile(0.9)}
+    
+    def to_dict(self) -> dict:
+        return {'low': self.low, 'high': self.high, 'width': self.width,
+                'counts': self.counts.tolist(), 'below': self.below, 'above': self.above,
+                'count': self.count, 'total': self.total,
+                'smallest': self.smallest, 'largest': self.largest}
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ScoreSketch':
+        sketch = cls(data['low'], data['high'], data['width'])
+        sketch.counts = np.array(data['counts'], dtype=np.int64)
+        for key in ('below', 'above', 'count', 'total', 'smallest', 'largest'):
+            setattr(sketch, key, data[key])
+        return sketch
+
+def score_sketch(user_token: str, course_id: int) -> ScoreSketch:
+    '''
+    Consumes a user_token and a course_id and produces a ScoreSketch of
+    the same score percentages plot_scores shows.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the unique identifier 
+                        of the course.
+    Returns: a ScoreSketch of the course's scores
+    '''
+    sketch = ScoreSketch()
+    sketch.add(course_frame(user_token, course_id).score_percentages())
+    return sketch
+
+def cohort_sketch(pairs: list) -> ScoreSketch:
+    '''
+    Consumes a list of (user_token, course_id) pairs and produces one
+    ScoreSketch of all of their scores, only ever holding one course's
+    scores at a time.
+    
+    Consumes:
+    1. pairs (list): (user_token, course_id) tuples
+    Returns: a merged ScoreSketch
+    '''
+    sketch = ScoreSketch()
+    for user_token, course_id in pairs:
+        sketch.merge(score_sketch(user_token, course_id))
+    return sketch
+
+def plot_scores(user_token: str, course_id: int, sketch: ScoreSketch = None,
+                path: str = None):
     '''
     consumes a user_token (a string) and a course_id 
     (an integer) and returns nothing but creates a graph 
     representing the distribution of the fractional 
-    scores in the course. 
+    scores in the course. If a sketch is given, its bins
+    are plotted instead, and user_token and course_id
+    are ignored.
     
     Consumes:
     1. user_token (str): a string that represents the user's 
                    unique identifier.
     2. course_id (int): an integer representing the unique identifier 
                   of the course.
-    Returns: nothing but creates a histogram
-             representing submission scores in a course.
+    3. sketch (ScoreSketch): a sketch to plot, perhaps merged
+                  across many users and courses
+    4. path (str): a file to save the histogram to instead
+                  of showing it
+    Returns: nothing (or the path the histogram was saved to)
+             but creates a histogram representing
+             submission scores in a course.
     '''
     
-    submissions = get_submissions(user_token, course_id)
-    data = []
-    for submission in submissions:
-        if submission.grade:
-            if submission.assignment.points_possible > 0:
-                data.append(submission.score/submission.assignment.points_possible*100)
-    plt.hist(data)
-    plt.title('Distribution of Fractional Scores in the Course')
-    plt.xlabel('Score Received')
-    plt.ylabel('Number of Assignments')
-    plt.show()
+    if sketch is None:
+        data = course_frame(user_token, course_id).score_percentages()
+    with instruments.phase('render'), _drawing(path) as plt:
+        if sketch is None:
+            plt.hist(data)
+        else:
+            edges = sketch.edges()
+            plt.hist(edges[:-1], bins=edges, weights=sketch.counts)
+        plt.title('Distribution of Fractional Scores in the Course')
+        plt.xlabel('Score Received')
+        plt.ylabel('Number of Assignments')
+        return _finish_plot(plt, path)
     
 def days_apart(first_date: str, second_date: str) -> int:
     """
@@ -402,13 +1905,11 @@ def days_apart(first_date: str, second_date: str) -> int:
     Returns: an integer representing the days between those
     two dates
     """
-    first_date = datetime.strptime(first_date, "%Y-%m-%dT%H:%M:%S%z")
-    second_date = datetime.strptime(second_date, "%Y-%m-%dT%H:%M:%S%z")
-    difference = second_date - first_date
+    difference = parse_timestamp(second_date) - parse_timestamp(first_date)
     
     return difference.days
 
-def plot_earliness(user_token: str, course_id: int):
+def plot_earliness(user_token: str, course_id: int, path: str = None):
     '''
     consumes two strings (representing two dates in ISO format)
     and produces an integer indicating how many days are between
@@ -419,23 +1920,42 @@ def plot_earliness(user_token: str, course_id: int):
                    unique identifier.
     2. course_id (int): an integer representing the unique identifier 
                   of the course.      
-    Returns: nothing but creates a graph representing the
-    lateness of each submission
+    3. path (str): a file to save the graph to instead of showing it
+    Returns: nothing (or the path the graph was saved to) but
+    creates a graph representing the lateness of each submission
     '''
-    submissions = get_submissions(user_token, course_id)
+    data = course_frame(user_token, course_id).earliness_days()
     
-    data = []
-    for submission in submissions:
-        if submission.submitted_at and submission.assignment.due_at:
-            data.append(days_apart(submission.submitted_at, submission.assignment.due_at))
+    with instruments.phase('render'), _drawing(path) as plt:
+        plt.hist(data)
+        plt.title('Lateness')
+        plt.xlabel('Due Dates')
+        plt.ylabel('Number of Assignments')
+        return _finish_plot(plt, path)
     
-    plt.hist(data)
-    plt.title('Lateness')
-    plt.xlabel('Due Dates')
-    plt.ylabel('Number of Assignments')
-    plt.show()
+def lateness_stats(user_token: str, course_id: int) -> dict:
+    '''
+    consumes a user_token (a string) and a course_id (an integer)
+    and produces a dictionary describing how late the submissions
+    with a due date were: the mean and median days late (negative
+    when early) and the percent submitted after the due date.
+    All three are 0.0 if nothing was submitted with a due date.
     
-def plot_points(user_token: str, course_id: int):
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                   unique identifier.
+    2. course_id (int): an integer representing the unique identifier 
+                  of the course.
+    Returns: a dictionary with 'mean', 'median' and 'percent_late'
+    '''
+    days = course_frame(user_token, course_id).lateness_days()
+    if len(days) == 0:
+        return {'mean': 0.0, 'median': 0.0, 'percent_late': 0.0}
+    return {'mean': float(np.mean(days)),
+            'median': float(np.median(days)),
+            'percent_late': float(np.mean(days > 0) * 100)}
+
+def plot_points(user_token: str, course_id: int, path: str = None):
     '''
     consumes a user_token (a string) and a course_id 
     (an integer) and returns nothing but creates a 
@@ -448,34 +1968,321 @@ def plot_points(user_token: str, course_id: int):
                    unique identifier.
     2. course_id (int): an integer representing the unique identifier 
                   of the course.
-    Returns: nothing but creates a graph comparing the points possible
-    for each assignment with the weighted points possible for that assignment
+    3. path (str): a file to save the graph to instead of showing it
+    Returns: nothing (or the path the graph was saved to) but creates
+    a graph comparing the points possible for each assignment with
+    the weighted points possible for that assignment
     '''
-    submissions = get_submissions(user_token, course_id)
-    possible_points = []
-    weighted_points = []
+    frame = course_frame(user_token, course_id)
+    total_weighted = frame.total_weighted()
+    if total_weighted == 0:
+        return
     
-    total_weighted = 0
-    for submission in submissions:
-        total_weighted += (submission.assignment.points_possible * submission.assignment.group.weight) / 100
-        if total_weighted == 0:
-            return
-        
-    compared_points = 0
-    points = 0
-    for submission in submissions:
-        points = (submission.assignment.points_possible)
-        compared_points = (submission.assignment.points_possible * submission.assignment.group.weight / total_weighted)
-        possible_points.append(points)
-        weighted_points.append(compared_points)
-        
-    plt.scatter(possible_points, weighted_points)
-    plt.title('Points Possible vs Weighted Points')
-    plt.xlabel('Points Possible')
-    plt.ylabel('Weighted Points Possible')
-    plt.show()
+    possible_points = frame.points_possible
+    weighted_points = frame.points_possible * frame.weight / total_weighted
+    
+    with instruments.phase('render'), _drawing(path) as plt:
+        plt.scatter(possible_points, weighted_points)
+        plt.title('Points Possible vs Weighted Points')
+        plt.xlabel('Points Possible')
+        plt.ylabel('Weighted Points Possible')
+        return _finish_plot(plt, path)
+    
+class GradeProjection:
+    '''
+    The three running sums plotted by predict_grades, kept up to date
+    as new grades arrive instead of being recomputed from scratch.
+    
+    Each assignment's share of the course (its group weight divided
+    by the course's total weighted points) is worked out once. For
+    every assignment the projection keeps its weighted points possible
+    and weighted score, and the course totals of:
+    - max_points: every weighted point in the course
+    - max_score: the weighted score if everything ungraded gets full marks
+    - min_score: the weighted score if everything ungraded gets zero
+    
+    Grading a submission changes the totals in O(1), so an update
+    costs O(changed); the running-sum series are only rebuilt (with
+    one cumsum) when they are asked for. A projection can be shared
+    between threads: updating and reading it take its lock.
+    
+    Consumes:
+    1. frame (SubmissionFrame): the course's submissions
+    '''
+    def __init__(self, frame: SubmissionFrame):
+        self.total_weighted = frame.total_weighted()
+        if self.total_weighted == 0:
+            share = np.zeros(len(frame))
+        else:
+            share = frame.weight / self.total_weighted
+        self.share = share
+        # What the shares were worked out from, to tell when they change
+        self.assignment_id = frame.assignment_id.copy()
+        self.weighted_points = frame.points_possible * frame.weight
+        self.position = {assignment_id: index for index, assignment_id
+                         in enumerate(frame.assignment_id.tolist())}
+        self.graded = frame.has_graded_at.copy()
+        self.possible = frame.points_possible * share
+        self.earned = np.where(self.graded, frame.score, 0.0) * share
+        self.max_points = float(self.possible.sum())
+        self.max_score = float(np.where(self.graded, self.earned, self.possible).sum())
+        self.min_score = float(self.earned.sum())
+        graded_at = frame.graded_at[~np.isnat(frame.graded_at)]
+        # The newest graded_at seen so far
+        self.watermark = graded_at.max() if len(graded_at) else np.datetime64('NaT', 's')
+        self._series = None
+        self._lock = threading.RLock()
+    
+    def grade(self, submission):
+        '''
+        Records that a submission has been graded, adjusting
+        the totals by the change in its weighted score. A graded
+        submission without a score counts as NaN, as it does in
+        a SubmissionFrame.
+        '''
+        index = self.position[submission.assignment.id]
+        score = np.nan if submission.score is None else submission.score
+        earned = score * float(self.share[index])
+        with self._lock:
+            before = float(self.earned[index])
+            if self.graded[index]:
+                replaced = before
+            else:
+                replaced = float(self.possible[index])
+                self.graded[index] = True
+            self.earned[index] = earned
+            if np.isnan(earned) or np.isnan(before):
+                # NaN never cancels out of a total, so add it up again
+                self.max_score = float(np.where(self.graded, self.earned, self.possible).sum())
+                self.min_score = float(self.earned.sum())
+            else:
+                self.max_score += earned - replaced
+                self.min_score += earned - before
+            self._series = None
+    
+    def update(self, submissions: list) -> int:
+        '''
+        Consumes a freshly fetched list of the course's submissions and
+        grades every one graded after the watermark (or graded while the
+        projection still has it ungraded). Produces how many changed.
+        Raises KeyError if an assignment is new, or any assignment's
+        points possible or group weight changed, since that changes
+        every assignment's share and the projection has to be rebuilt.
+        '''
+        if len(submissions) != len(self.graded):
+            raise KeyError("the course's assignments changed")
+        assignment_id = np.fromiter((submission.assignment.id for submission in submissions),
+                                    dtype=np.int64, count=len(submissions))
+        weighted_points = np.fromiter((submission.assignment.points_possible *
+                                       submission.assignment.group.weight
+                                       for submission in submissions),
+                                      dtype=np.float64, count=len(submissions))
+        if (not np.array_equal(assignment_id, self.assignment_id) or
+                not np.array_equal(weighted_points, self.weighted_points, equal_nan=True)):
+            raise KeyError("the course's assignments, points or weights changed")
+        candidates = [submission for submission in submissions if submission.graded_at]
+        graded_at = parse_timestamps([submission.graded_at for submission in candidates])
+        if np.isnat(self.watermark):
+            newer = np.ones(len(candidates), dtype=bool)
+        else:
+            newer = graded_at > self.watermark
+        changed = 0
+        with self._lock:
+            for submission, is_newer in zip(candidates, newer.tolist()):
+                if is_newer or not self.graded[self.position[submission.assignment.id]]:
+                    self.grade(submission)
+                    changed += 1
+            if len(graded_at):
+                newest = graded_at.max()
+                if np.isnat(self.watermark) or newest > self.watermark:
+                    self.watermark = newest
+        return changed
+    
+    def series(self) -> tuple:
+        '''
+        Produces the max_points, max_score and min_score running
+        sums, one value per assignment, as numpy arrays.
+        '''
+        with self._lock:
+            if self._series is None:
+                self._series = (np.cumsum(self.possible),
+                                np.cumsum(np.where(self.graded, self.earned, self.possible)),
+                                np.cumsum(self.earned))
+            return self._series
+    
+    def as_dict(self) -> dict:
+        '''
+        Produces the final values of the three running sums, as
+        percentages of the course.
+        '''
+        with self._lock:
+            return {'max_points': self.max_points, 'max_score': self.max_score,
+                    'min_score': self.min_score}
+
+# (user_token, course_id) -> GradeProjection, least recently used first.
+# Kept outside of fetch_cache so that a projection outlives its
+# submissions and can be brought up to date when they are fetched again.
+projections = OrderedDict()
+# The most projections to keep; the least recently used go first
+max_projections = 4096
+projections_lock = threading.Lock()
+
+def drop_projections(user_token: str = None):
+    '''
+    Throws away the kept projections of a user_token (or of every
+    user, if it is None), so they are built again from scratch.
+    '''
+    with projections_lock:
+        for key in list(projections):
+            if user_token is None or key[0] == user_token:
+                del projections[key]
+
+def grade_projection(user_token: str, course_id: int) -> GradeProjection:
+    '''
+    Consumes a user_token and a course_id and produces the course's
+    GradeProjection. It is built once; after that, whenever the course's
+    submissions have been fetched again it is only updated with the
+    submissions graded since.
     
-def predict_grades(user_token: str, course_id: int):
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the unique identifier 
+                        of the course.
+    Returns: the course's GradeProjection
+    '''
+    submissions = fetch_submissions(user_token, course_id)
+    # Derived once per fetch, so each fetch is only looked through once
+    return fetch_cache.derive(user_token, course_id, 'projection', submissions,
+                              lambda: _project(user_token, course_id, submissions))
+
+def _project(user_token: str, course_id: int, submissions: list) -> GradeProjection:
+    '''
+    Brings the course's projection up to date with freshly fetched
+    submissions, or builds it from them if there is none yet (or
+    the course's assignments changed), and produces it.
+    '''
+    key = (user_token, course_id)
+    with projections_lock:
+        projection = projections.get(key)
+    if projection is not None:
+        try:
+            projection.update(submissions)
+        except KeyError:
+            projection = None
+    if projection is None:
+        projection = GradeProjection(submission_frame(user_token, course_id, submissions))
+    with projections_lock:
+        projections[key] = projection
+        projections.move_to_end(key)
+        while len(projections) > max_projections:
+            projections.popitem(last=False)
+    return projection
+
+def project_grades(user_token: str, course_id: int) -> dict:
+    '''
+    consumes a user_token (a string) and a course_id (an integer) and
+    produces the final values of predict_grades' three lines without
+    plotting: the course's weighted points, the best weighted score
+    still possible, and the worst.
+    
+    Consumes:
+    1. user_token (str): a string that represents the user's 
+                         unique identifier.
+    2. course_id (int): an integer representing the unique identifier 
+                        of the course.
+    Returns: a dictionary with 'max_points', 'max_score' and 'min_score'
+    '''
+    return grade_projection(user_token, course_id).as_dict()
+
+# The lowest course percentage that earns each letter grade
+GRADE_CUTOFFS = [('A', 90.0), ('B', 80.0), ('C', 70.0), ('D', 60.0), ('F', float('-inf'))]
+
+def simulate_grades(frame: SubmissionFrame, scenarios: int = 10000, seed: int = None):
+    '''
+    Simulates the weighted final grade (as a course percentage, like
+    predict_grades' lines) of `scenarios` ways the ungraded submissions
+    could turn out. Each ungraded assignment's fraction of its points
+    is drawn from the fractions the student already earned in the
+    same group, or in the whole course if the group has none yet, or
+    uniformly from 0 to 1 if nothing is graded at all.
+
+    The draws for each group are made as one scenarios x assignments
+    matrix (in blocks, so memory stays bounded) and reduced with a
+    matrix-vector product by the assignments' weighted points.
+
+    Consumes:
+    1. frame (SubmissionFrame): the course's submissions
+    2. scenarios (int): how many outcomes to simulate
+    3. seed (int): the random seed, for repeatable results
+    Returns: an array of `scenarios` final grades
+    '''
+    projection = GradeProjection(frame)
+    finals = np.full(scenarios, float(projection.earned.sum()))
+    ungraded = ~projection.graded
+    if not ungraded.any():
+        return finals
+
+    rng = np.random.default_rng(seed)
+    known = projection.graded & ~np.isnan(frame.score) & (frame.points_possible > 0)
+    fractions = frame.score[known] / frame.points_possible[known]
+    for group in np.unique(frame.group_id[ungraded]).tolist():
+        history = fractions[frame.group_id[known] == group]
+        if len(history) == 0:
+            history = fractions
+        possible = projection.possible[ungraded & (frame.group_id == group)]
+        # Keep each block of draws to about a million values
+        block = max(1, 1000000 // scenarios)
+        for start in range(0, len(possible), block):
+            weights = possible[start:start + block]
+            if len(history):
+                draws = history[rng.integers(0, len(history), size=(scenarios, len(weights)))]
+            else:
+                draws = rng.random((scenarios, len(weights)))
+            finals += draws @ weights
+    return finals
+
+def what_if(user_token: str, course_id: int, scenarios: int = 10000, seed: int = None) -> dict:
+    '''
+    consumes a user_token (a string) and a course_id (an integer) and
+    produces what the student's final grade will probably be, from
+    `scenarios` simulated outcomes of their ungraded work (see
+    simulate_grades): the mean, the 5th, 50th and 95th percentiles,
+    and the chance of each letter grade.
+
+    Consumes:
+    1. user_token (str): a string that represents the user's
+                         unique identifier.
+    2. course_id (int): an integer representing the unique identifier
+                        of the course.
+    3. scenarios (int): how many outcomes to simulate
+    4. seed (int): the random seed, for repeatable results
+    Returns: a dictionary with 'scenarios', 'mean', 'p5', 'p50',
+    'p95' and 'letters' (letter grade -> probability)
+    '''
+    finals = simulate_grades(course_frame(user_token, course_id), scenarios, seed)
+    p5, p50, p95 = np.percentile(finals, [5, 50, 95]).tolist()
+    letters = {}
+    remaining = np.ones(len(finals), dtype=bool)
+    for letter, cutoff in GRADE_CUTOFFS:
+        earned = remaining & (finals >= cutoff)
+        letters[letter] = float(earned.mean())
+        remaining &= ~earned
+    return {'scenarios': scenarios, 'mean': float(finals.mean()),
+            'p5': p5, 'p50': p50, 'p95': p95, 'letters': letters}
+
+def format_what_if(outlook: dict) -> str:
+    '''
+    Produces the string the 'whatif' command prints for what_if's result.
+    '''
+    printed = ('Likely final grade: ' + str(round(outlook['p50'], 2)) +
+               ' (90% between ' + str(round(outlook['p5'], 2)) +
+               ' and ' + str(round(outlook['p95'], 2)) + ')')
+    for letter, chance in outlook['letters'].items():
+        printed += '\n' + letter + ': ' + str(round(chance * 100, 1)) + '%'
+    return printed
+
+def predict_grades(user_token: str, course_id: int, path: str = None):
     '''
     consumes a user_token (a string) 
     and a course_id (an integer) and returns 
@@ -486,44 +2293,157 @@ def predict_grades(user_token: str, course_id: int):
                          unique identifier.
     2. course_id (int): an integer representing the unique identifier 
                             of the course.
-    Returns: nothing but creates a graph comparing the points possible
+    3. path (str): a file to save the graph to instead of showing it
+    Returns: nothing (or the path the graph was saved to)
+    but creates a graph comparing the points possible
     for each assignment with three running sum lines representing:
         1. the maximum weughted points possible in the course
         2. the maximum weighted score in the course
         3. the minimum possible weited score in the course
     '''
-    submissions = get_submissions(user_token, course_id)
-    total_max_points = 0
-    total_max_score = 0
-    total_min_score = 0
-    max_points = []
-    max_score = []
-    min_score = []
-    total_weighted = 0
-    for submission in submissions:
-        total_weighted += (submission.assignment.points_possible * submission.assignment.group.weight) / 100
+    projection = grade_projection(user_token, course_id)
+    if projection.total_weighted == 0:
+        return
+    max_points, max_score, min_score = projection.series()
     
-    for submission in submissions:
-        total_max_points += submission.assignment.points_possible * submission.assignment.group.weight / total_weighted
-        if submission.graded_at:
-            total_min_score += submission.score * submission.assignment.group.weight / total_weighted
-            total_max_score += submission.score * submission.assignment.group.weight / total_weighted
-        else:
-            total_max_score += submission.assignment.points_possible * submission.assignment.group.weight / total_weighted
-        
-        max_points.append(total_max_points)
-        max_score.append(total_max_score)
-        min_score.append(total_min_score)
-        
-    plt.plot(max_points, label = 'Max Points')
-    plt.plot(max_score, label = 'Max Score')
-    plt.plot(min_score, label = 'Min Score')
-    plt.title('What Grade Will I Earn?')
-    plt.xlabel('Weighted Points')
-    plt.ylabel('Course Percentage')
-    plt.legend()
-    plt.show()
+    with instruments.phase('render'), _drawing(path) as plt:
+        plt.plot(max_points, label = 'Max Points')
+        plt.plot(max_score, label = 'Max Score')
+        plt.plot(min_score, label = 'Min Score')
+        plt.title('What Grade Will I Earn?')
+        plt.xlabel('Weighted Points')
+        plt.ylabel('Course Percentage')
+        plt.legend()
+        return _finish_plot(plt, path)
+
+# The commands a batch job can run: command -> (function, argument types).
+# Each function is called with the job's user_token and course_id
+# (unless it takes no course_id), followed by the converted arguments.
+batch_commands = {
+    'courses': (lambda user_token, course_id: render_courses(user_token), []),
+    'course': (find_course, []),
+    'all': (lambda user_token, course_id: report_all(user_token), []),
+    'points': (total_points, []),
+    'comments': (count_comments, []),
+    'graded': (ratio_graded, []),
+    'score_unweighted': (average_score, []),
+    'score': (average_weighted, []),
+    'group': (average_group, [str]),
+    'groups': (lambda user_token, course_id: course_summary(user_token, course_id).group_breakdown(), []),
+    'summary': (lambda user_token, course_id: course_summary(user_token, course_id).as_dict(), []),
+    'assignment': (render_assignment, [int]),
+    'list': (render_all, []),
+    'export': (lambda user_token, course_id, path: export_submissions(user_token, course_id, path), [str]),
+    'lateness': (lateness_stats, []),
+    'projection': (project_grades, []),
+    'whatif': (what_if, []),
+    'percentiles': (lambda user_token, course_id: score_sketch(user_token, course_id).percentiles(), []),
+}
 
+def run_command(command: str, user_token: str, course_id: int, args: list = ()):
+    '''
+    Consumes a command from batch_commands, a user_token, a course_id
+    and the command's arguments, and produces the command's result
+    without printing or prompting for anything.
+    
+    Consumes:
+    1. command (str): the name of a command in batch_commands
+    2. user_token (str): a string that represents the user's 
+                         unique identifier.
+    3. course_id (int): an integer representing the unique identifier 
+                        of the course.
+    4. args (list): the command's arguments, converted to the
+                    types batch_commands expects
+    Returns: whatever the command's function produces
+    '''
+    if command not in batch_commands:
+        raise ValueError('unknown batch command: ' + str(command))
+    function, arg_types = batch_commands[command]
+    if len(args) != len(arg_types):
+        raise ValueError(command + ' takes ' + str(len(arg_types)) + ' arguments')
+    converted = [arg_type(arg) for arg_type, arg in zip(arg_types, args)]
+    return function(user_token, course_id, *converted)
+
+def read_jobs(text: str) -> list:
+    '''
+    Consumes the contents of a batch file and produces its jobs as
+    dictionaries with user_token, course_id, command and args.
+    
+    The file is either a JSON list of such dictionaries, or a
+    command script with one job per line:
+        user_token course_id command [args...]
+    where blank lines and lines starting with # are skipped. Words
+    are split like a shell does, so an argument with spaces can be
+    quoted: troy 394382 group "Final Exam"
+    
+    Consumes:
+    1. text (str): the contents of the batch file
+    Returns: a list of job dictionaries
+    '''
+    if text.lstrip().startswith('['):
+        jobs = json.loads(text)
+        for job in jobs:
+            if not isinstance(job, dict):
+                raise ValueError('expected a job dictionary: ' + json.dumps(job))
+            job.setdefault('course_id', 0)
+            job.setdefault('args', [])
+        return jobs
+    jobs = []
+    for line in text.splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        try:
+            words = shlex.split(line)
+        except ValueError as error:
+            raise ValueError(str(error) + ': ' + line)
+        if len(words) < 3:
+            raise ValueError('expected "user_token course_id command": ' + line)
+        jobs.append({'user_token': words[0], 'course_id': int(words[1]),
+                     'command': words[2], 'args': words[3:]})
+    return jobs
+
+def run_batch(jobs: list):
+    '''
+    Consumes a list of job dictionaries (see read_jobs) and yields a
+    result dictionary for each one, in order. Jobs share fetched data
+    through fetch_cache, so a user's course is only fetched once for
+    the whole batch. A job that fails gets an 'error' instead of a
+    'result', and the rest of the batch still runs, even if the
+    job itself is malformed (not a dictionary, or missing fields).
+    
+    Consumes:
+    1. jobs (list): job dictionaries with user_token, course_id,
+                    command and args
+    Returns: a generator of dictionaries with the job's fields,
+    'result' or 'error', and 'seconds' it took
+    '''
+    for job in jobs:
+        outcome = {}
+        started = time.perf_counter()
+        try:
+            outcome = {'user_token': job.get('user_token'), 'course_id': job.get('course_id', 0),
+                       'command': job.get('command'), 'args': job.get('args', [])}
+            outcome['result'] = run_command(outcome['command'], outcome['user_token'],
+                                            outcome['course_id'], outcome['args'])
+        except Exception as error:
+            outcome['error'] = type(error).__name__ + ': ' + str(error)
+        outcome['seconds'] = time.perf_counter() - started
+        yield outcome
+
+def write_batch(jobs: list, sink):
+    '''
+    Runs the jobs with run_batch and writes each result to the
+    file-like sink as one line of JSON (JSON Lines).
+    
+    Consumes:
+    1. jobs (list): job dictionaries (see read_jobs)
+    2. sink: anything with a write(str) method
+    Returns: nothing
+    '''
+    for outcome in run_batch(jobs):
+        sink.write(json.dumps(outcome) + '\n')
+
+@instruments.around_command
 def execute(command: str, user_token: str, course_id: int) -> int:
     '''
     Consumes a command, user_token, ans course_id to return
@@ -543,9 +2463,13 @@ def execute(command: str, user_token: str, course_id: int) -> int:
     if command == 'exit':
         return 0
     elif command == 'course':
-        print (render_courses(user_token))
-        course_id = int(input('enter your course ID: '))
+        write_stream(stream_courses(user_token), sys.stdout)
+        print ()
+        with instruments.phase('input'):
+            course_id = int(input('enter your course ID: '))
         print (find_course(user_token, course_id)) 
+    elif command == 'all':
+        print (report_all(user_token))
     elif command == 'points':
         print (total_points(user_token, course_id))
     elif command == 'comments':
@@ -556,22 +2480,60 @@ def execute(command: str, user_token: str, course_id: int) -> int:
         print (average_score(user_token, course_id))
     elif command == 'score':
         print (average_weighted(user_token, course_id))
+    elif command == 'summary':
+        print (render_summary(user_token, course_id))
     elif command == 'group':
-        group_name = input('Enter a Group Name: ')
+        with instruments.phase('input'):
+            group_name = input('Enter a Group Name: ')
         print (average_group(user_token, course_id, group_name))
+    elif command == 'groups':
+        print (render_groups(user_token, course_id), end='')
     elif command == 'assignment':
-        assignment_id = int(input('Enter an Assignment ID: '))
+        with instruments.phase('input'):
+            assignment_id = int(input('Enter an Assignment ID: '))
         print(render_assignment(user_token, course_id, assignment_id))
     elif command == 'list': 
-        print (render_all(user_token, course_id))
+        write_stream(stream_all(user_token, course_id), sys.stdout)
+        print ()
+    elif command == 'export':
+        with instruments.phase('input'):
+            path = input('Enter a File Name (.csv, .parquet or .arrow): ')
+        print (export_submissions(user_token, course_id, path), 'submissions written')
     elif command == 'scores':
-        print (plot_scores(user_token, course_id))
+        print (plot_scores(user_token, course_id,
+                           path=plot_path(user_token, course_id, 'scores')))
+    elif command == 'percentiles':
+        print (score_sketch(user_token, course_id).percentiles())
     elif command == 'earliness':
-        print (plot_earliness(user_token, course_id))
+        print (plot_earliness(user_token, course_id,
+                              plot_path(user_token, course_id, 'earliness')))
+    elif command == 'lateness':
+        print (lateness_stats(user_token, course_id))
     elif command == 'compare':
-        print (plot_points(user_token, course_id))
+        print (plot_points(user_token, course_id,
+                           plot_path(user_token, course_id, 'points')))
     elif command == 'predict':
-        print (predict_grades(user_token, course_id))
+        print (predict_grades(user_token, course_id,
+                              plot_path(user_token, course_id, 'grades')))
+    elif command == 'projection':
+        print (project_grades(user_token, course_id))
+    elif command == 'whatif':
+        print (format_what_if(what_if(user_token, course_id)))
+    elif command == 'refresh':
+        fetch_cache.invalidate(user_token)
+        drop_projections(user_token)
+        print ('Course data will be fetched again')
+    elif command == 'cache':
+        print (fetch_cache.render_stats())
+        print (backend_limiter.render_stats())
+    elif command == 'stats':
+        if not instruments.enabled:
+            instruments.enabled = True
+            print ('Timing every command from now on')
+        else:
+            print (instruments.render_stats())
+    elif command == 'profile':
+        print (instruments.toggle_profiler())
     elif command == 'help':
         print (help_commands)
     return course_id      
@@ -588,7 +2550,7 @@ def main(user_token: str):
     display results
     '''
     cs1 = 0
-    list_of_courses = get_courses(user_token)
+    list_of_courses = fetch_courses(user_token)
     if count_courses(user_token) == 0:
         print ('No courses available')
         return
@@ -602,5 +2564,67 @@ def main(user_token: str):
         what_to_do = input('Enter Your Command or type "help": ')
         print (cs1)
         cs1 = (execute(what_to_do, user_token, cs1))
-        
-main()
+
+def cli(argv: list = None):
+    '''
+    Reads the command line arguments and starts the application
+    for the user_token they name.
+    
+    Consumes:
+    1. argv (list): the command line arguments, not including the
+                    program name (sys.argv is used when None)
+    Returns: nothing
+    '''
+    parser = argparse.ArgumentParser(description='Explore your Canvas courses.')
+    parser.add_argument('user_token', nargs='?', help="the user's unique identifier")
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run the jobs in FILE (a JSON list or a command script) '
+                             'and print their results as JSON Lines instead of prompting')
+    parser.add_argument('--stats', action='store_true',
+                        help="time every command (see the 'stats' command)")
+    parser.add_argument('--stats-json', metavar='FILE',
+                        help='time every command and write the timings to FILE on exit')
+    parser.add_argument('--profile', action='store_true',
+                        help='profile every command with cProfile and print the profile on exit')
+    parser.add_argument('--max-fetches', type=int, default=8,
+                        help='how many requests to Canvas may run at once')
+    parser.add_argument('--fetch-rate', type=float, default=None,
+                        help='how many requests to Canvas may start per second')
+    parser.add_argument('--save-plots', metavar='DIR',
+                        help='draw plots without a display and save them as files in DIR')
+    parser.add_argument('--plot-format', default='png',
+                        help='the file format of saved plots (png, svg, pdf, ...)')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='start from the data saved in FILE, and save changes back to it')
+    parser.add_argument('--offline', action='store_true',
+                        help='answer everything from the --snapshot without reaching Canvas')
+    args = parser.parse_args(argv)
+    if args.offline and not args.snapshot:
+        parser.error('--offline needs a --snapshot FILE')
+    if args.snapshot:
+        import canvas_snapshot
+        user_token = None if args.batch else args.user_token
+        canvas_snapshot.open_session(args.snapshot, user_token, args.offline)
+    limit_backend(args.max_fetches, args.fetch_rate)
+    if args.save_plots:
+        save_plots(args.save_plots, args.plot_format)
+    instruments.enabled = args.stats or bool(args.stats_json)
+    if args.profile:
+        instruments.toggle_profiler()
+    try:
+        if args.batch:
+            with open(args.batch) as batch_file:
+                jobs = read_jobs(batch_file.read())
+            write_batch(jobs, sys.stdout)
+        elif args.user_token:
+            main(args.user_token)
+        else:
+            parser.error('a user_token or --batch FILE is required')
+    finally:
+        if args.stats_json:
+            instruments.dump(args.stats_json)
+        if instruments.profiler is not None:
+            print (instruments.toggle_profiler(), file=sys.stderr)
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,244 @@
+'''
+Async counterparts of the canvas_data functions, for serving many
+users from one event loop. Every function here has the same name,
+arguments and result as its blocking version in canvas_data, but
+awaits the data it needs instead of blocking on bakery_canvas.
+
+Data comes from canvas_data.backend (see canvas_data.use_backend) and
+is shared with the blocking functions through canvas_data.fetch_cache.
+If the backend's get_courses/get_submissions are coroutines (like
+fake_canvas.AsyncFakeCanvas) they are awaited directly, otherwise
+they run on a worker thread. Either way they go through
+canvas_data.backend_limiter and the instruments, and a fetch already
+in flight (from a task or a thread) is waited for instead of repeated.
+At most `max_concurrency_per_user` fetches per user_token are in
+flight at once.
+
+The plot functions, execute and main are interactive and have no
+async counterparts.
+'''
+import asyncio
+import inspect
+import time
+import weakref
+import canvas_data
+from canvas_data import (CourseIndex, CourseSummary, SubmissionFrame,
+                         compact_submissions, fetch_cache, format_assignment,
+                         format_course, format_groups, format_report,
+                         format_submission, format_summary, submission_frame)
+
+max_concurrency_per_user = 4
+
+# event loop -> {user_token -> asyncio.Semaphore limiting that user's
+# fetches}, since a semaphore can only be used from one loop
+_limits = weakref.WeakKeyDictionary()
+
+def _limit(user_token: str) -> asyncio.Semaphore:
+    '''
+    Produces the semaphore limiting how many fetches the
+    user can have in flight at once in the running loop.
+    '''
+    limits = _limits.setdefault(asyncio.get_running_loop(), {})
+    if user_token not in limits:
+        limits[user_token] = asyncio.Semaphore(max_concurrency_per_user)
+    return limits[user_token]
+
+async def _call_backend(name: str, user_token: str, *args):
+    '''
+    Calls the backend function called `name` with the user_token
+    and args within backend_limiter's limits, awaiting it if it is
+    a coroutine and otherwise running it on a worker thread.
+    '''
+    fetch = getattr(canvas_data.backend, name)
+    async with _limit(user_token):
+        if not inspect.iscoroutinefunction(fetch):
+            return await asyncio.to_thread(canvas_data.call_backend, fetch, user_token, *args)
+        started = time.perf_counter()
+        value = await canvas_data.backend_limiter.acall(fetch, user_token, *args)
+        if canvas_data.instruments.enabled:
+            canvas_data.instruments.record_fetch(time.perf_counter() - started, value)
+        return value
+
+async def fetch_courses(user_token: str) -> list:
+    '''
+    Consumes a user_token and produces the user's courses, only
+    calling the backend when they are not already in fetch_cache.
+    '''
+    return await fetch_cache.aget(user_token, None,
+                                  lambda: _call_backend('get_courses', user_token))
+
+async def fetch_submissions(user_token: str, course_id: int) -> list:
+    '''
+    Consumes a user_token and a course_id and produces the user's
+    submissions in that course, only calling the backend when they
+    are not already in fetch_cache.
+    '''
+    async def fetch():
+        # Compacted here, so waiting tasks get the compact records too
+        return compact_submissions(
+            await _call_backend('get_submissions', user_token, course_id))
+    return await fetch_cache.aget(user_token, course_id, fetch)
+
+async def course_index(user_token: str) -> CourseIndex:
+    '''
+    Produces the CourseIndex of the user's courses, built
+    once per fetch (see canvas_data.course_index).
+    '''
+    courses = await fetch_courses(user_token)
+    return fetch_cache.derive(user_token, None, 'index', courses,
+                              lambda: CourseIndex(courses))
+
+async def assignment_index(user_token: str, course_id: int) -> dict:
+    '''
+    Produces a dictionary from assignment id to the user's
+    submission for it (see canvas_data.assignment_index).
+    '''
+    submissions = await fetch_submissions(user_token, course_id)
+    return fetch_cache.derive(user_token, course_id, 'index', submissions,
+                              lambda: {submission.assignment.id: submission
+                                       for submission in submissions})
+
+async def course_frame(user_token: str, course_id: int) -> SubmissionFrame:
+    '''
+    Produces the SubmissionFrame of the user's
+    submissions in the course, built once per fetch.
+    '''
+    submissions = await fetch_submissions(user_token, course_id)
+    return submission_frame(user_token, course_id, submissions)
+
+async def course_summary(user_token: str, course_id: int) -> CourseSummary:
+    '''
+    Produces the CourseSummary of the user's submissions in the
+    course, shared with canvas_data.course_summary.
+    '''
+    submissions = await fetch_submissions(user_token, course_id)
+    return fetch_cache.derive(user_token, course_id, 'summary', submissions,
+                              lambda: CourseSummary(
+                                  submission_frame(user_token, course_id, submissions)))
+
+async def count_courses(user_token: str) -> int:
+    '''
+    Produces how many courses the user is taking.
+    '''
+    return len(await fetch_courses(user_token))
+
+async def find_cs1(user_token: str) -> int:
+    '''
+    Produces the id of the user's CISC1 course, or 0 if they have none.
+    '''
+    course = (await course_index(user_token)).by_code_prefix.get('CISC1')
+    if course is None:
+        return 0
+    return course.id
+
+async def find_course(user_token: str, course_id: int) -> str:
+    '''
+    Produces the name of the user's course with the course_id,
+    or 'no course found'.
+    '''
+    course = (await course_index(user_token)).by_id.get(course_id)
+    if course is None:
+        return 'no course found'
+    return course.name
+
+async def render_courses(user_token: str) -> str:
+    '''
+    Produces one 'id: code' line for each of the user's courses.
+    '''
+    courses = await fetch_courses(user_token)
+    return ''.join(format_course(course) for course in courses)
+
+async def report_all(user_token: str, timeout: float = 30.0) -> str:
+    '''
+    Awaits the submissions of every one of the user's courses at once
+    and produces the same table as canvas_data.report_all.
+    '''
+    courses = await fetch_courses(user_token)
+    fetches = {}
+    for course in courses:
+        fetches[course.id] = asyncio.ensure_future(course_summary(user_token, course.id))
+    if fetches:
+        await asyncio.wait(fetches.values(), timeout=timeout)
+
+    table = ''
+    for course in courses:
+        fetch = fetches[course.id]
+        table += str(course.id) + ': ' + str(course.code) + ' | '
+        if not fetch.done():
+            fetch.cancel()
+            table += 'timed out\n'
+        elif fetch.exception() is not None:
+            table += 'could not be fetched\n'
+        else:
+            table += format_report(fetch.result())
+    return table
+
+async def total_points(user_token: str, course_id: int) -> int:
+    '''
+    Produces the total points possible in the course.
+    '''
+    return (await course_summary(user_token, course_id)).total_points
+
+async def count_comments(user_token: str, course_id: int) -> int:
+    '''
+    Produces how many comments the user's submissions in the course got.
+    '''
+    return (await course_summary(user_token, course_id)).comments
+
+async def ratio_graded(user_token: str, course_id: int) -> str:
+    '''
+    Produces a 'graded/total' string of the user's submissions in the course.
+    '''
+    return (await course_summary(user_token, course_id)).ratio_graded()
+
+async def average_score(user_token: str, course_id: int) -> float:
+    '''
+    Produces the user's unweighted average score in the course.
+    '''
+    return (await course_summary(user_token, course_id)).average_score()
+
+async def average_weighted(user_token: str, course_id: int) -> float:
+    '''
+    Produces the user's average score in the course,
+    weighted by the assignment groups' weights.
+    '''
+    return (await course_summary(user_token, course_id)).average_weighted()
+
+async def average_group(user_token: str, course_id: int, group_name: str) -> float:
+    '''
+    Produces the user's unweighted average score in
+    the course's assignment group called group_name.
+    '''
+    return (await course_summary(user_token, course_id)).average_group(group_name)
+
+async def render_groups(user_token: str, course_id: int) -> str:
+    '''
+    Produces the table of the course's assignment groups
+    (see canvas_data.render_groups).
+    '''
+    return format_groups(await course_summary(user_token, course_id))
+
+async def render_summary(user_token: str, course_id: int) -> str:
+    '''
+    Produces the summary of the course's statistics
+    (see canvas_data.render_summary).
+    '''
+    return format_summary(await course_summary(user_token, course_id))
+
+async def render_assignment(user_token: str, course_id: int, assignment_id: int) -> str:
+    '''
+    Produces a description of the user's submission for the
+    assignment, or 'Assignment not found: ' and its id.
+    '''
+    submission = (await assignment_index(user_token, course_id)).get(assignment_id)
+    if submission is None:
+        return "Assignment not found: " + str(assignment_id)
+    return format_assignment(submission)
+
+async def render_all(user_token: str, course_id: int) -> str:
+    '''
+    Produces one line for each of the user's
+    submissions in the course, graded or not.
+    '''
+    submissions = await fetch_submissions(user_token, course_id)
+    return ''.join(format_submission(submission) for submission in submissions)
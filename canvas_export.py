@@ -0,0 +1,249 @@
+'''
+Exports submissions as flat tables for analysts: one row per
+submission with its assignment, group and weight, and timestamps
+already parsed to UTC.
+
+    write_export([('annie', 679554), ('jeff', 679554)], 'cs1.parquet')
+
+or from the command line, where a user_token without a course_id
+exports every one of that user's courses:
+
+    python canvas_export.py cs1.csv annie:679554 jeff:679554 troy
+
+Rows are produced in record batches of a fixed size (the last one may
+be smaller) and each batch is written before the next is built, so
+memory stays bounded however many courses are exported. CSV needs
+nothing extra; Parquet and Arrow IPC files need pyarrow.
+'''
+import argparse
+import csv
+import numpy as np
+import canvas_data
+
+# The columns of every export, in order
+COLUMNS = ['user_token', 'course_id', 'assignment_id', 'assignment_name', 'module',
+           'group', 'weight', 'points_possible', 'score', 'grade', 'status',
+           'comments', 'submitted_at', 'due_at', 'graded_at']
+
+# file extension -> format
+FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.arrow': 'arrow',
+           '.feather': 'arrow', '.ipc': 'arrow'}
+
+def _pyarrow():
+    '''
+    Imports pyarrow only when a Parquet or Arrow file is written,
+    since CSV exports do not need it.
+    '''
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet and Arrow exports need pyarrow (pip install pyarrow)')
+    return pyarrow
+
+def _build_batch(rows: list) -> dict:
+    '''
+    Produces a dictionary of columns from a list of
+    (user_token, course_id, submission) tuples.
+    '''
+    assignments = [submission.assignment for user_token, course_id, submission in rows]
+    submissions = [submission for user_token, course_id, submission in rows]
+    return {
+        'user_token': [user_token for user_token, course_id, submission in rows],
+        'course_id': np.array([course_id for user_token, course_id, submission in rows],
+                              dtype=np.int64),
+        'assignment_id': np.array([assignment.id for assignment in assignments], dtype=np.int64),
+        'assignment_name': [assignment.name for assignment in assignments],
+        'module': [assignment.module for assignment in assignments],
+        'group': [assignment.group.name for assignment in assignments],
+        'weight': np.array([assignment.group.weight for assignment in assignments],
+                           dtype=np.float64),
+        'points_possible': np.array([assignment.points_possible for assignment in assignments],
+                                    dtype=np.float64),
+        'score': np.array([np.nan if submission.score is None else submission.score
+                           for submission in submissions], dtype=np.float64),
+        'grade': [submission.grade for submission in submissions],
+        'status': [submission.status for submission in submissions],
+        'comments': np.array([len(submission.comments) if submission.comments else 0
+                              for submission in submissions], dtype=np.int64),
+        'submitted_at': canvas_data.parse_timestamps(
+            [submission.submitted_at for submission in submissions]),
+        'due_at': canvas_data.parse_timestamps([assignment.due_at for assignment in assignments]),
+        'graded_at': canvas_data.parse_timestamps(
+            [submission.graded_at for submission in submissions]),
+    }
+
+def expand_pairs(pairs: list) -> list:
+    '''
+    Produces the (user_token, course_id) pairs to export, replacing
+    a course_id of None with every one of the user's courses.
+    '''
+    expanded = []
+    for user_token, course_id in pairs:
+        if course_id is None:
+            expanded.extend((user_token, course.id)
+                            for course in canvas_data.fetch_courses(user_token))
+        else:
+            expanded.append((user_token, course_id))
+    return expanded
+
+def submission_batches(pairs: list, batch_size: int = 10000):
+    '''
+    Consumes a list of (user_token, course_id) pairs and yields their
+    submissions as dictionaries of columns (see COLUMNS), batch_size
+    rows at a time. Numbers are numpy arrays (NaN for missing scores),
+    text columns are lists and timestamps are UTC datetime64[s]
+    arrays (NaT when missing).
+
+    Consumes:
+    1. pairs (list): (user_token, course_id) tuples, where a
+                     course_id of None means all of the user's courses
+    2. batch_size (int): how many rows each batch has
+    Returns: a generator of dictionaries of columns
+    '''
+    pending = []
+    for user_token, course_id in expand_pairs(pairs):
+        for submission in canvas_data.fetch_submissions(user_token, course_id):
+            pending.append((user_token, course_id, submission))
+            if len(pending) == batch_size:
+                yield _build_batch(pending)
+                pending = []
+    if pending:
+        yield _build_batch(pending)
+
+def _csv_column(name: str, values) -> list:
+    '''
+    Produces a column's values as CSV cells, with
+    missing scores and timestamps left empty.
+    '''
+    if name in ('submitted_at', 'due_at', 'graded_at'):
+        texts = np.datetime_as_string(values, unit='s', timezone='UTC')
+        return ['' if missing else text for text, missing in zip(texts.tolist(), np.isnat(values))]
+    if name == 'score':
+        return ['' if np.isnan(value) else value for value in values.tolist()]
+    if isinstance(values, np.ndarray):
+        return values.tolist()
+    return ['' if value is None else value for value in values]
+
+def write_csv(batches, sink) -> int:
+    '''
+    Writes the batches to the file-like sink as CSV with a header
+    row, and produces how many rows were written.
+    '''
+    writer = csv.writer(sink)
+    writer.writerow(COLUMNS)
+    written = 0
+    for batch in batches:
+        columns = [_csv_column(name, batch[name]) for name in COLUMNS]
+        writer.writerows(zip(*columns))
+        written += len(batch['course_id'])
+    return written
+
+def arrow_schema():
+    '''
+    Produces the pyarrow schema of an export.
+    '''
+    pa = _pyarrow()
+    timestamp = pa.timestamp('s', tz='UTC')
+    return pa.schema([('user_token', pa.string()), ('course_id', pa.int64()),
+                      ('assignment_id', pa.int64()), ('assignment_name', pa.string()),
+                      ('module', pa.string()), ('group', pa.string()),
+                      ('weight', pa.float64()), ('points_possible', pa.float64()),
+                      ('score', pa.float64()), ('grade', pa.string()),
+                      ('status', pa.string()), ('comments', pa.int64()),
+                      ('submitted_at', timestamp), ('due_at', timestamp),
+                      ('graded_at', timestamp)])
+
+def arrow_batch(batch: dict, schema):
+    '''
+    Converts a dictionary of columns into a pyarrow RecordBatch,
+    with missing scores and timestamps as nulls.
+    '''
+    pa = _pyarrow()
+    arrays = []
+    for field in schema:
+        values = batch[field.name]
+        if field.name == 'score':
+            arrays.append(pa.array(values, type=field.type, mask=np.isnan(values)))
+        elif field.name in ('submitted_at', 'due_at', 'graded_at'):
+            arrays.append(pa.array(values, type=field.type, mask=np.isnat(values)))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_arrow(batches, path: str, format: str = 'parquet') -> int:
+    '''
+    Writes the batches to a Parquet file, or an Arrow IPC file if
+    format is 'arrow', one record batch (or row group) at a time,
+    and produces how many rows were written.
+    '''
+    pa = _pyarrow()
+    schema = arrow_schema()
+    if format == 'parquet':
+        writer = pa.parquet.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    written = 0
+    with writer:
+        for batch in batches:
+            record_batch = arrow_batch(batch, schema)
+            if format == 'parquet':
+                writer.write_table(pa.Table.from_batches([record_batch]))
+            else:
+                writer.write_batch(record_batch)
+            written += record_batch.num_rows
+    return written
+
+def write_export(pairs: list, path: str, format: str = None, batch_size: int = 10000) -> int:
+    '''
+    Consumes a list of (user_token, course_id) pairs and writes all of
+    their submissions to a CSV, Parquet or Arrow IPC file.
+
+    Consumes:
+    1. pairs (list): (user_token, course_id) tuples, where a
+                     course_id of None means all of the user's courses
+    2. path (str): the file to write
+    3. format (str): 'csv', 'parquet' or 'arrow', or None to go by
+                     the file's extension
+    4. batch_size (int): how many rows to build and write at a time
+    Returns: the number of rows written
+    '''
+    if format is None:
+        extension = path[path.rfind('.'):].lower() if '.' in path else ''
+        if extension not in FORMATS:
+            raise ValueError('cannot tell the format of ' + path +
+                             ' (use .csv, .parquet or .arrow)')
+        format = FORMATS[extension]
+    if format not in ('csv', 'parquet', 'arrow'):
+        raise ValueError('unknown export format: ' + str(format))
+    batches = submission_batches(pairs, batch_size)
+    if format == 'csv':
+        with open(path, 'w', newline='') as sink:
+            return write_csv(batches, sink)
+    return write_arrow(batches, path, format)
+
+def read_pair(text: str) -> tuple:
+    '''
+    Produces the (user_token, course_id) pair written as
+    "user_token:course_id", or (user_token, None) for "user_token".
+    '''
+    user_token, colon, course_id = text.partition(':')
+    return user_token, int(course_id) if colon else None
+
+def cli(argv: list = None):
+    parser = argparse.ArgumentParser(description='Export submissions to CSV, Parquet or Arrow.')
+    parser.add_argument('path', help='the file to write (.csv, .parquet or .arrow)')
+    parser.add_argument('pairs', nargs='+', metavar='user_token[:course_id]',
+                        help='whose submissions to export (every course if no course_id)')
+    parser.add_argument('--format', choices=['csv', 'parquet', 'arrow'],
+                        help='the file format (default: from the extension)')
+    parser.add_argument('--batch-size', type=int, default=10000,
+                        help='how many rows to write at a time')
+    args = parser.parse_args(argv)
+    written = write_export([read_pair(pair) for pair in args.pairs], args.path,
+                           args.format, args.batch_size)
+    print (str(written) + ' submissions written to ' + args.path)
+
+if __name__ == '__main__':
+    cli()
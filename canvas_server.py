@@ -0,0 +1,239 @@
+'''
+A long-running local server answering canvas_data's batch commands
+over HTTP, so that other programs (like the advising portal) can ask
+for grade summaries without starting a process per question. Fetched
+courses and submissions stay in canvas_data.fetch_cache between
+requests, so only the first question about a course waits for Canvas.
+
+    python canvas_server.py --port 8750
+    python canvas_server.py --unix /tmp/canvas.sock
+
+Every request runs one job, exactly like a line of a --batch file:
+
+    GET  /run?user_token=annie&course_id=679554&command=score
+    GET  /run?user_token=annie&course_id=679554&command=group&args=Homework
+    POST /run   with a JSON job, or a JSON list of jobs
+    GET  /stats     request latency percentiles, cache hits and backend calls
+    GET  /commands  the commands that can be run
+
+and answers with the job's result dictionary from canvas_data.run_batch
+as JSON. Requests are served on their own threads.
+
+Only the read-only commands in served_commands can be run: anything
+that writes files (like export) is left out, since any local program,
+or a web page in a local browser, can send requests to the server.
+'''
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import json
+import os
+import socket
+import threading
+import numpy as np
+import canvas_data
+
+class LatencyStats:
+    '''
+    Remembers how long the last `window` requests of every command
+    took, for reporting percentiles.
+
+    Consumes:
+    1. window (int): how many recent requests per command to keep
+    '''
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self.requests = 0
+        self.errors = 0
+        # command -> deque of seconds
+        self._seconds = {}
+        self._lock = threading.Lock()
+
+    def record(self, command: str, seconds: float, failed: bool = False):
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+            if command not in self._seconds:
+                self._seconds[command] = deque(maxlen=self.window)
+            self._seconds[command].append(seconds)
+
+    def as_dict(self) -> dict:
+        '''
+        Produces a dictionary with the request and error counts, and
+        the count and 50th/90th/99th percentile and maximum latency
+        in milliseconds of every command and of all of them together.
+        '''
+        with self._lock:
+            samples = {command: np.array(seconds) * 1000
+                       for command, seconds in self._seconds.items()}
+            stats = {'requests': self.requests, 'errors': self.errors}
+        samples['all'] = np.concatenate(list(samples.values())) if samples else np.zeros(0)
+        stats['latency_ms'] = {}
+        for command, milliseconds in samples.items():
+            if len(milliseconds) == 0:
+                continue
+            p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99])
+            stats['latency_ms'][command] = {'count': len(milliseconds),
+                                            'p50': float(p50), 'p90': float(p90),
+                                            'p99': float(p99),
+                                            'max': float(milliseconds.max())}
+        return stats
+
+latency_stats = LatencyStats()
+
+# The batch commands clients may run. Commands are only added here
+# if they read data and nothing else.
+served_commands = frozenset([
+    'courses', 'course', 'all', 'points', 'comments', 'graded', 'score_unweighted',
+    'score', 'group', 'groups', 'summary', 'assignment', 'list', 'lateness',
+    'projection', 'percentiles', 'whatif'])
+
+def run_job(job: dict) -> dict:
+    '''
+    Runs one job dictionary (see canvas_data.read_jobs) and produces
+    its result dictionary, recording how long it took. Raises
+    ValueError or TypeError if the job is not a dictionary or its
+    course_id or args are not a number and a list.
+    '''
+    if not isinstance(job, dict):
+        raise ValueError('expected a job dictionary, not ' + json.dumps(job))
+    job = {'user_token': job.get('user_token'), 'course_id': int(job.get('course_id', 0)),
+           'command': job.get('command'), 'args': list(job.get('args', []))}
+    if job['command'] in served_commands:
+        outcome = next(canvas_data.run_batch([job]))
+        command = job['command']
+    else:
+        outcome = dict(job, error='ValueError: not a served command: ' + str(job['command']),
+                       seconds=0.0)
+        # Unknown commands share one entry, so clients cannot grow latency_stats
+        command = 'unknown'
+    latency_stats.record(command, outcome['seconds'], 'error' in outcome)
+    return outcome
+
+class CanvasHandler(BaseHTTPRequestHandler):
+    '''
+    Answers the requests described at the top of this module.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, value, status: int = 200):
+        body = json.dumps(value).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/run':
+            query = parse_qs(url.query)
+            job = {'user_token': query.get('user_token', [None])[0],
+                   'course_id': query.get('course_id', ['0'])[0],
+                   'command': query.get('command', [None])[0],
+                   'args': query.get('args', [])}
+            try:
+                self.send_json(run_job(job))
+            except (TypeError, ValueError) as error:
+                self.send_json({'error': str(error)}, 400)
+        elif url.path == '/stats':
+            stats = latency_stats.as_dict()
+            stats['cache'] = canvas_data.fetch_cache.render_stats()
+            stats['backend'] = canvas_data.backend_limiter.render_stats()
+            self.send_json(stats)
+        elif url.path == '/commands':
+            self.send_json(sorted(served_commands))
+        else:
+            self.send_json({'error': 'not found: ' + url.path}, 404)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != '/run':
+            self.send_json({'error': 'not found: ' + self.path}, 404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            jobs = json.loads(self.rfile.read(length) or b'null')
+            if isinstance(jobs, list):
+                self.send_json([run_job(job) for job in jobs])
+            elif isinstance(jobs, dict):
+                self.send_json(run_job(jobs))
+            else:
+                self.send_json({'error': 'expected a job or a list of jobs'}, 400)
+        except (TypeError, ValueError) as error:
+            self.send_json({'error': str(error)}, 400)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class CanvasServer(ThreadingHTTPServer):
+    '''
+    A threaded HTTP server for CanvasHandler, listening on a TCP
+    (host, port) address or, if unix_path is given, a Unix socket.
+    '''
+    daemon_threads = True
+
+    def __init__(self, address: tuple = ('127.0.0.1', 8750), unix_path: str = None,
+                 verbose: bool = False):
+        self.verbose = verbose
+        self.unix_path = unix_path
+        if unix_path is not None:
+            self.address_family = socket.AF_UNIX
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            address = unix_path
+        super().__init__(address, CanvasHandler)
+
+    def server_bind(self):
+        if self.unix_path is None:
+            super().server_bind()
+        else:
+            # HTTPServer.server_bind expects a (host, port) address
+            self.socket.bind(self.unix_path)
+            self.server_name = 'localhost'
+            self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        if self.unix_path is not None and os.path.exists(self.unix_path):
+            os.remove(self.unix_path)
+
+def cli(argv: list = None):
+    parser = argparse.ArgumentParser(description='Serve canvas_data commands over local HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8750)
+    parser.add_argument('--unix', metavar='PATH',
+                        help='listen on a Unix socket instead of a TCP port')
+    parser.add_argument('--ttl', type=float, default=canvas_data.fetch_cache.ttl,
+                        help='how many seconds fetched data stays fresh')
+    parser.add_argument('--cache-size', type=int, default=4096,
+                        help='how many users\' courses and submissions to keep warm')
+    parser.add_argument('--max-fetches', type=int, default=8,
+                        help='how many requests to Canvas may run at once')
+    parser.add_argument('--fetch-rate', type=float, default=None,
+                        help='how many requests to Canvas may start per second')
+    parser.add_argument('--snapshot', metavar='FILE',
+                        help='start from the data saved in FILE, and save changes back to it')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+    canvas_data.fetch_cache.ttl = args.ttl
+    canvas_data.fetch_cache.max_size = args.cache_size
+    canvas_data.limit_backend(args.max_fetches, args.fetch_rate)
+    if args.snapshot:
+        import canvas_snapshot
+        canvas_snapshot.open_session(args.snapshot)
+    server = CanvasServer((args.host, args.port), args.unix, args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    cli()
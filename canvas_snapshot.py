@@ -0,0 +1,302 @@
+'''
+An on-disk SQLite snapshot of users' courses, assignment groups,
+assignments and submissions, so that a session can start from the
+last one's data instead of pulling everything from Canvas again.
+
+    store = SnapshotStore('canvas.sqlite')
+    warm_cache(store, 'annie')                     # instant first results
+    canvas_data.use_backend(SnapshotBackend(store, bakery_canvas))
+
+With a live backend, every fetch still goes to Canvas but only the
+records that changed are written back: a submission is rewritten
+when its submitted_at or graded_at marker (or its score, grade or
+status) differs from the snapshot. Without one (offline mode) every
+command is served from the snapshot alone.
+
+Records come back as fake_canvas Course/Group/Assignment/Submission
+objects, with the submissions of a course sharing their Assignment
+and Group objects. Comments are kept as strings, since only how many
+there are is ever used.
+'''
+import json
+import sqlite3
+import threading
+import canvas_data
+from fake_canvas import Assignment, Course, Group, Submission
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS courses (
+    user_token TEXT, course_id INTEGER, position INTEGER, name TEXT, code TEXT,
+    PRIMARY KEY (user_token, course_id));
+CREATE TABLE IF NOT EXISTS groups (
+    user_token TEXT, course_id INTEGER, name TEXT, weight REAL,
+    PRIMARY KEY (user_token, course_id, name));
+CREATE TABLE IF NOT EXISTS assignments (
+    user_token TEXT, course_id INTEGER, assignment_id INTEGER, name TEXT,
+    module TEXT, points_possible REAL, due_at TEXT, group_name TEXT,
+    PRIMARY KEY (user_token, course_id, assignment_id));
+CREATE TABLE IF NOT EXISTS submissions (
+    user_token TEXT, course_id INTEGER, assignment_id INTEGER, position INTEGER,
+    score REAL, grade TEXT, status TEXT, comments TEXT,
+    submitted_at TEXT, graded_at TEXT,
+    PRIMARY KEY (user_token, course_id, assignment_id));
+CREATE TABLE IF NOT EXISTS synced (
+    user_token TEXT, course_id INTEGER,
+    PRIMARY KEY (user_token, course_id));
+'''
+
+# course_id of the synced row recording that a user's courses are stored
+COURSES = -1
+
+def _number(value):
+    '''
+    Produces an integer for whole-number floats (SQLite hands back
+    REAL columns as floats), so points print as they did from Canvas.
+    '''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+class SnapshotStore:
+    '''
+    A SQLite file holding snapshots of users' Canvas data, safe to use
+    from several threads.
+
+    Consumes:
+    1. path (str): the file to keep the snapshot in (':memory:' works
+                   for a snapshot that only lasts the session)
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._connection.close()
+
+    def load_courses(self, user_token: str) -> list:
+        '''
+        Produces the user's courses from the snapshot, in the order
+        Canvas gave them, or None if they were never stored.
+        '''
+        with self._lock:
+            if not self._is_synced(user_token, COURSES):
+                return None
+            rows = self._connection.execute(
+                'SELECT course_id, name, code FROM courses WHERE user_token = ? '
+                'ORDER BY position', (user_token,)).fetchall()
+        return [Course(course_id, name, code) for course_id, name, code in rows]
+
+    def save_courses(self, user_token: str, courses: list) -> int:
+        '''
+        Stores the user's courses, only writing the ones that are new
+        or changed and deleting the ones the user no longer takes.
+        Produces how many rows were written or deleted.
+        '''
+        rows = [(user_token, course.id, position, course.name, str(course.code))
+                for position, course in enumerate(courses)]
+        with self._lock, self._connection:
+            stored = {row[1]: tuple(row) for row in self._connection.execute(
+                'SELECT user_token, course_id, position, name, code FROM courses '
+                'WHERE user_token = ?', (user_token,))}
+            changed = [row for row in rows if stored.get(row[1]) != row]
+            gone = set(stored) - set(row[1] for row in rows)
+            self._connection.executemany('INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?)', changed)
+            self._connection.executemany('DELETE FROM courses WHERE user_token = ? AND course_id = ?',
+                                         [(user_token, course_id) for course_id in gone])
+            self._mark_synced(user_token, COURSES)
+        return len(changed) + len(gone)
+
+    def load_submissions(self, user_token: str, course_id: int) -> list:
+        '''
+        Produces the user's submissions in the course from the snapshot,
+        in the order Canvas gave them, or None if they were never stored.
+        '''
+        with self._lock:
+            if not self._is_synced(user_token, course_id):
+                return None
+            groups = {name: Group(name, weight) for name, weight in self._connection.execute(
+                'SELECT name, weight FROM groups WHERE user_token = ? AND course_id = ?',
+                (user_token, course_id))}
+            assignments = {}
+            for row in self._connection.execute(
+                    'SELECT assignment_id, name, module, points_possible, due_at, group_name '
+                    'FROM assignments WHERE user_token = ? AND course_id = ?',
+                    (user_token, course_id)):
+                assignments[row[0]] = Assignment(row[0], row[1], row[2], _number(row[3]),
+                                                 row[4], groups[row[5]])
+            rows = self._connection.execute(
+                'SELECT assignment_id, score, grade, status, comments, submitted_at, graded_at '
+                'FROM submissions WHERE user_token = ? AND course_id = ? ORDER BY position',
+                (user_token, course_id)).fetchall()
+        return [Submission(assignments[row[0]], row[1], row[2], row[3], json.loads(row[4]),
+                           row[5], row[6])
+                for row in rows]
+
+    def sync_submissions(self, user_token: str, course_id: int, submissions: list) -> int:
+        '''
+        Brings the snapshot of the user's submissions in the course up to
+        date with a fresh list from Canvas. Only submissions whose markers
+        changed (and assignments or groups that changed) are written, and
+        submissions that disappeared are deleted. Produces how many
+        submission rows were written or deleted.
+        '''
+        groups = {}
+        assignments = {}
+        rows = []
+        for position, submission in enumerate(submissions):
+            assignment = submission.assignment
+            group = assignment.group
+            groups[group.name] = (user_token, course_id, group.name, group.weight)
+            assignments[assignment.id] = (user_token, course_id, assignment.id, assignment.name,
+                                          assignment.module, assignment.points_possible,
+                                          assignment.due_at, group.name)
+            comments = [str(comment) for comment in submission.comments or []]
+            rows.append((user_token, course_id, assignment.id, position, submission.score,
+                         submission.grade, submission.status, json.dumps(comments),
+                         submission.submitted_at, submission.graded_at))
+
+        with self._lock, self._connection:
+            key = (user_token, course_id)
+            stored_groups = {row[2]: tuple(row) for row in self._connection.execute(
+                'SELECT * FROM groups WHERE user_token = ? AND course_id = ?', key)}
+            stored_assignments = {row[2]: tuple(row) for row in self._connection.execute(
+                'SELECT * FROM assignments WHERE user_token = ? AND course_id = ?', key)}
+            # The change markers, plus what grading and commenting change
+            stored_markers = {row[0]: tuple(row[1:]) for row in self._connection.execute(
+                'SELECT assignment_id, position, score, grade, status, comments, '
+                'submitted_at, graded_at '
+                'FROM submissions WHERE user_token = ? AND course_id = ?', key)}
+
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?)',
+                [row for name, row in groups.items() if stored_groups.get(name) != row])
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO assignments VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [row for assignment_id, row in assignments.items()
+                 if stored_assignments.get(assignment_id) != row])
+            changed = [row for row in rows if stored_markers.get(row[2]) != row[3:]]
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', changed)
+            gone = [key + (assignment_id,) for assignment_id in set(stored_markers) - set(assignments)]
+            self._connection.executemany(
+                'DELETE FROM submissions WHERE user_token = ? AND course_id = ? AND assignment_id = ?', gone)
+            self._connection.executemany(
+                'DELETE FROM assignments WHERE user_token = ? AND course_id = ? AND assignment_id = ?', gone)
+            self._mark_synced(user_token, course_id)
+        return len(changed) + len(gone)
+
+    def _is_synced(self, user_token: str, course_id: int) -> bool:
+        return self._connection.execute(
+            'SELECT 1 FROM synced WHERE user_token = ? AND course_id = ?',
+            (user_token, course_id)).fetchone() is not None
+
+    def _mark_synced(self, user_token: str, course_id: int):
+        self._connection.execute('INSERT OR IGNORE INTO synced VALUES (?, ?)', (user_token, course_id))
+
+class SnapshotBackend:
+    '''
+    A canvas_data backend that keeps a SnapshotStore up to date.
+
+    With a live backend (like bakery_canvas), every fetch goes to it and
+    the changes are synced into the store. Without one, the store is
+    the only source and a user or course that was never stored has no
+    courses or submissions.
+
+    Consumes:
+    1. store (SnapshotStore): the snapshot to read and write
+    2. live: the backend to fetch from, or None to stay offline
+    '''
+    def __init__(self, store: SnapshotStore, live=None):
+        self.store = store
+        self.live = live
+
+    def get_courses(self, user_token: str) -> list:
+        if self.live is None:
+            return self.store.load_courses(user_token) or []
+        courses = self.live.get_courses(user_token)
+        self.store.save_courses(user_token, courses)
+        return courses
+
+    def get_submissions(self, user_token: str, course_id: int) -> list:
+        if self.live is None:
+            return self.store.load_submissions(user_token, course_id) or []
+        submissions = self.live.get_submissions(user_token, course_id)
+        self.store.sync_submissions(user_token, course_id, submissions)
+        return submissions
+
+def warm_cache(store: SnapshotStore, user_token: str) -> int:
+    '''
+    Loads the user's courses and submissions from the snapshot straight
+    into canvas_data.fetch_cache, so the first commands of a session are
+    answered without waiting on Canvas. Produces how many courses were
+    loaded.
+
+    Consumes:
+    1. store (SnapshotStore): the snapshot to load from
+    2. user_token (str): a string that represents the user's
+                         unique identifier.
+    Returns: the number of courses loaded
+    '''
+    courses = store.load_courses(user_token)
+    if courses is None:
+        return 0
+    canvas_data.fetch_cache.store(user_token, None, courses)
+    for course in courses:
+        submissions = store.load_submissions(user_token, course.id)
+        if submissions is not None:
+            canvas_data.fetch_cache.store(user_token, course.id,
+                                          canvas_data.compact_submissions(submissions))
+    return len(courses)
+
+def sync_user(store: SnapshotStore, live, user_token: str) -> int:
+    '''
+    Fetches all of the user's courses and submissions from the live
+    backend, syncs the changes into the snapshot and replaces what
+    canvas_data.fetch_cache holds with the fresh data. Produces how many
+    rows changed.
+
+    Consumes:
+    1. store (SnapshotStore): the snapshot to update
+    2. live: the backend to fetch from
+    3. user_token (str): a string that represents the user's
+                         unique identifier.
+    Returns: the number of rows written or deleted
+    '''
+    courses = canvas_data.backend_limiter.call(live.get_courses, user_token)
+    changed = store.save_courses(user_token, courses)
+    canvas_data.fetch_cache.store(user_token, None, courses)
+    for course in courses:
+        submissions = canvas_data.backend_limiter.call(live.get_submissions,
+                                                       user_token, course.id)
+        changed += store.sync_submissions(user_token, course.id, submissions)
+        canvas_data.fetch_cache.store(user_token, course.id,
+                                      canvas_data.compact_submissions(submissions))
+    return changed
+
+def open_session(path: str, user_token: str = None, offline: bool = False) -> SnapshotStore:
+    '''
+    Opens the snapshot at path and points canvas_data at it. If a
+    user_token is given, that user's stored data is loaded into the cache
+    right away and (unless offline) a background thread syncs it with
+    Canvas while the session starts.
+
+    Consumes:
+    1. path (str): the snapshot file
+    2. user_token (str): the user to load, or None to load nobody
+    3. offline (bool): whether to serve everything from the snapshot
+    Returns: the open SnapshotStore
+    '''
+    store = SnapshotStore(path)
+    live = None if offline else canvas_data.backend
+    canvas_data.use_backend(SnapshotBackend(store, live))
+    if user_token is None:
+        return store
+    warmed = warm_cache(store, user_token)
+    if live is not None:
+        if warmed:
+            threading.Thread(target=sync_user, args=(store, live, user_token), daemon=True).start()
+        else:
+            sync_user(store, live, user_token)
+    return store
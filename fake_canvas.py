@@ -0,0 +1,204 @@
+'''
+A local stand-in for bakery_canvas, holding courses and submissions
+in memory. Pass a FakeCanvas to canvas_data.use_backend to run every
+function without reaching Canvas, or use an AsyncFakeCanvas with
+canvas_data_async to serve many users from one event loop.
+
+generate_canvas makes up a FakeCanvas of any size, for benchmarks.
+'''
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+import asyncio
+import random
+import time
+
+@dataclass
+class Course:
+    id: int
+    name: str
+    code: str
+
+@dataclass
+class Group:
+    name: str
+    weight: float
+
+@dataclass
+class Assignment:
+    id: int
+    name: str
+    module: str
+    points_possible: int
+    due_at: str
+    group: Group
+
+@dataclass
+class Submission:
+    assignment: Assignment
+    score: float
+    grade: str
+    status: str
+    comments: list = field(default_factory=list)
+    submitted_at: str = None
+    graded_at: str = None
+
+class FakeCanvas:
+    '''
+    A backend with the same get_courses and get_submissions functions
+    as bakery_canvas, answering from dictionaries.
+
+    Consumes:
+    1. courses (dict): user_token -> list of Course
+    2. submissions (dict): (user_token, course_id) -> list of Submission
+    3. latency (float): how many seconds every call should take,
+                        to imitate the round trip to Canvas
+    '''
+    def __init__(self, courses: dict = None, submissions: dict = None,
+                 latency: float = 0.0):
+        self.courses = courses if courses is not None else {}
+        self.submissions = submissions if submissions is not None else {}
+        self.latency = latency
+        self.calls = 0
+
+    def add_course(self, user_token: str, course: Course, submissions: list):
+        '''
+        Enrolls the user in the course, with the given submissions.
+        '''
+        self.courses.setdefault(user_token, []).append(course)
+        self.submissions[(user_token, course.id)] = submissions
+
+    def get_courses(self, user_token: str) -> list:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.courses.get(user_token, []))
+
+    def get_submissions(self, user_token: str, course_id: int) -> list:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return list(self.submissions.get((user_token, course_id), []))
+
+    def get_submissions_page(self, user_token: str, course_id: int,
+                             page: int, page_size: int) -> list:
+        '''
+        Produces one page of the user's submissions in the course, like
+        a paginated Canvas request: the page_size submissions starting
+        at page * page_size, or fewer on the last page.
+        '''
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        start = page * page_size
+        return self.submissions.get((user_token, course_id), [])[start:start + page_size]
+
+class AsyncFakeCanvas(FakeCanvas):
+    '''
+    A FakeCanvas whose get_courses and get_submissions are coroutines,
+    waiting with asyncio.sleep so that an event loop can serve other
+    users during the imitated round trip.
+    '''
+    async def get_courses(self, user_token: str) -> list:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return list(self.courses.get(user_token, []))
+
+    async def get_submissions(self, user_token: str, course_id: int) -> list:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return list(self.submissions.get((user_token, course_id), []))
+
+def generate_course(course_id: int, assignments: int, groups: int = 4,
+                    rng: random.Random = None) -> tuple:
+    '''
+    Makes up a course with the given number of assignments spread over
+    `groups` assignment groups, whose weights add up to 100. Due dates
+    are a day apart, starting on 2017-01-02.
+    
+    Consumes:
+    1. course_id (int): the ID to give the course
+    2. assignments (int): how many assignments the course has
+    3. groups (int): how many assignment groups the course has
+    4. rng (random.Random): where the random choices come from
+    Returns: a tuple of the Course and its list of Assignments
+    '''
+    rng = rng or random.Random(course_id)
+    course = Course(course_id, 'Synthetic Course ' + str(course_id),
+                    'SYN' + str(course_id))
+    raw_weights = [rng.randint(1, 10) for index in range(groups)]
+    course_groups = [Group('Group ' + str(index), raw_weights[index] * 100 / sum(raw_weights))
+                     for index in range(groups)]
+    start = datetime(2017, 1, 2, 23, 59, tzinfo=timezone.utc)
+    course_assignments = []
+    for index in range(assignments):
+        due = start + timedelta(days=index)
+        course_assignments.append(Assignment(
+            course_id * 100000 + index, 'Assignment ' + str(index),
+            'Module ' + str(index // 10 + 1), rng.choice([5, 10, 20, 50, 100]),
+            due.strftime('%Y-%m-%dT%H:%M:%S%z'), course_groups[index % groups]))
+    return course, course_assignments
+
+def generate_submissions(assignments: list, rng: random.Random,
+                         graded_ratio: float = 0.8) -> list:
+    '''
+    Makes up one student's submissions to the assignments: most are
+    graded, some ungraded or missing, with up to 3 comments and a
+    submission time anywhere from 5 days early to 2 days late.
+    
+    Consumes:
+    1. assignments (list): the Assignments to submit to
+    2. rng (random.Random): where the random choices come from
+    3. graded_ratio (float): the chance that a submission is graded
+    Returns: a list of Submissions, one per assignment
+    '''
+    submissions = []
+    for assignment in assignments:
+        due = datetime.strptime(assignment.due_at, '%Y-%m-%dT%H:%M:%S%z')
+        submitted = due + timedelta(hours=rng.randint(-120, 48))
+        comments = ['Comment ' + str(index) for index in range(rng.randint(0, 3))]
+        if rng.random() < graded_ratio:
+            score = float(rng.randint(assignment.points_possible // 2, assignment.points_possible))
+            percent = score / assignment.points_possible if assignment.points_possible else 1
+            grade = 'A' if percent >= 0.9 else 'B' if percent >= 0.8 else 'C' if percent >= 0.7 else 'F'
+            graded = submitted + timedelta(days=rng.randint(1, 7))
+            submissions.append(Submission(assignment, score, grade, 'graded', comments,
+                                          submitted.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                                          graded.strftime('%Y-%m-%dT%H:%M:%S%z')))
+        elif rng.random() < 0.5:
+            submissions.append(Submission(assignment, None, None, 'submitted', comments,
+                                          submitted.strftime('%Y-%m-%dT%H:%M:%S%z')))
+        else:
+            submissions.append(Submission(assignment, None, None, 'unsubmitted'))
+    return submissions
+
+def generate_canvas(users: int = 1, courses: int = 1, assignments: int = 100,
+                    groups: int = 4, seed: int = 0, latency: float = 0.0) -> FakeCanvas:
+    '''
+    Makes up a FakeCanvas where each of `users` students (with the
+    user_tokens 'student0', 'student1', ...) takes the same `courses`
+    courses, each with `assignments` assignments. The same seed
+    always produces the same data. Courses get IDs 1, 2, 3, ...
+    
+    The number of submissions is users * courses * assignments, so
+    for example 100 users in 10 courses of 1000 assignments make 1M.
+    
+    Consumes:
+    1. users (int): how many students to make up
+    2. courses (int): how many courses every student takes
+    3. assignments (int): how many assignments each course has
+    4. groups (int): how many assignment groups each course has
+    5. seed (int): the random seed
+    6. latency (float): the FakeCanvas's imitated round trip
+    Returns: a FakeCanvas holding the made up data
+    '''
+    rng = random.Random(seed)
+    canvas = FakeCanvas(latency=latency)
+    made_up = [generate_course(course_id, assignments, groups, rng)
+               for course_id in range(1, courses + 1)]
+    for user in range(users):
+        for course, course_assignments in made_up:
+            canvas.add_course('student' + str(user), course,
+                              generate_submissions(course_assignments, rng))
+    return canvas
@@ -0,0 +1,633 @@
+'''
+Checks canvas_data against the built-in Canvas users (annie, jeff,
+troy, ...). Run it with pytest, or on its own with
+`python test_canvas_data.py`.
+
+These used to run every time canvas_data was imported; they live here
+so that importing canvas_data never calls the backend.
+'''
+from bakery import assert_equal
+from bakery.assertions import student_tests
+from datetime import timezone
+import builtins
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import numpy as np
+import bakery_canvas
+import canvas_charts
+import canvas_data
+import canvas_cohort
+import canvas_export
+import canvas_server
+import canvas_snapshot
+import fake_canvas
+from canvas_data import *
+
+# How long `import canvas_data` may take, in microseconds,
+# as measured by python -X importtime
+IMPORT_TIME_BUDGET = 500000
+
+# pytest calls these around every test: bakery's assert_equal prints
+# failures instead of raising, so count them and fail the test instead
+_failures_before = 0
+
+def setup_function(function):
+    global _failures_before
+    _failures_before = student_tests.failures
+
+def teardown_function(function):
+    failed = student_tests.failures - _failures_before
+    assert failed == 0, str(failed) + ' assert_equal checks failed'
+
+def test_count_courses():
+    assert_equal(count_courses('annie'), 6)
+    assert_equal(count_courses('jeff'), 6)
+    assert_equal(count_courses('pierce'), 0)
+    assert_equal(count_courses('troy'), 1)
+
+def test_find_cs1():
+    assert_equal(find_cs1('annie'), 100167)
+    assert_equal(find_cs1('jeff'), 100167)
+    assert_equal(find_cs1('pierce'), 0)
+    assert_equal(find_cs1('troy'), 0)
+
+def test_find_course():
+    assert_equal(find_course('annie', 394382), 'History of Ice Cream')
+    assert_equal(find_course('jeff', 600), 'no course found')
+    assert_equal(find_course('abed', 134088), 'Physical Education Education')
+
+def test_render_courses():
+    assert_equal(render_courses('annie'), '679554: MATH101\n386814: ENGL101\n4182: SPAN101\n394382: ICRM304\n100167: CISC1\n134088: PHED201\n')
+    assert_equal(render_courses('troy'), '394382: ICRM304')
+    assert_equal(render_courses('pierce'), '')
+
+def test_total_points():
+    assert_equal(total_points('annie', 679554), 420)
+    assert_equal(total_points('annie', 386814), 700)
+    assert_equal(total_points('annie', 100167), 1060)
+    assert_equal(total_points('jeff', 679554), 420)
+    assert_equal(total_points('jeff', 386814), 700)
+    assert_equal(total_points('troy', 394382), 100)
+
+def test_count_comments():
+    assert_equal(count_comments('annie', 679554), 14)
+    assert_equal(count_comments('troy', 394382), 0)
+
+def test_ratio_graded():
+    assert_equal(ratio_graded('annie', 679554), '10/10')
+    assert_equal(ratio_graded('annie', 134088), '6/11')
+    assert_equal(ratio_graded('shirley', 134088), '7/11')
+
+def test_average_score():
+    assert_equal(average_score('annie', 679554), 0.95)
+    assert_equal(average_score('annie', 386814), 0.97)
+    assert_equal(average_score('jeff', 386814), 0.7)
+
+def test_average_weighted():
+    assert_equal (average_weighted('annie', 679554), 0.9471153846153846)
+    assert_equal (average_weighted('annie', 386814), 0.97)
+    assert_equal (average_weighted('jeff', 386814), 0.7)
+
+def test_average_group():
+    assert_equal(average_group('annie', 679554, 'Homework'), 0.9636363636363636)
+    assert_equal(average_group('troy', 394382, 'Assignments'), 0.8)
+
+def test_group_breakdown():
+    use_backend(fake_canvas.generate_canvas(assignments=30, groups=3))
+    try:
+        breakdown = course_summary('student0', 1).group_breakdown()
+        assert_equal([group['name'] for group in breakdown], ['Group 0', 'Group 1', 'Group 2'])
+        assert_equal([group['average'] for group in breakdown],
+                     [average_group('student0', 1, group['name'].upper()) for group in breakdown])
+        assert_equal(sum(group['submissions'] for group in breakdown), 30)
+        assert_equal(render_groups('student0', 1).count('\n'), 3)
+    finally:
+        use_backend(bakery_canvas)
+
+def test_stream_summary():
+    use_backend(fake_canvas.generate_canvas(assignments=250, groups=3))
+    try:
+        pages = [len(page) for page in iter_submissions('student0', 1, page_size=100)]
+        assert_equal(pages, [100, 100, 50])
+        streamed = stream_summary('student0', 1, page_size=64)
+        whole = course_summary('student0', 1)
+        assert_equal(streamed.total_points, whole.total_points)
+        assert_equal(streamed.comments, whole.comments)
+        assert_equal(streamed.ratio_graded(), whole.ratio_graded())
+        assert_equal(round(streamed.average_weighted(), 9), round(whole.average_weighted(), 9))
+        # Without get_submissions_page, the whole list is sliced but not cached
+        canvas = fake_canvas.generate_canvas(assignments=250, groups=3)
+        use_backend(types.SimpleNamespace(get_courses=canvas.get_courses,
+                                          get_submissions=canvas.get_submissions))
+        pages = [len(page) for page in iter_submissions('student0', 1, page_size=100)]
+        assert_equal(pages, [100, 100, 50])
+        assert_equal(stream_summary('student0', 1).total_points, whole.total_points)
+        assert_equal(fetch_cache.lookup('student0', 1), (False, None))
+    finally:
+        use_backend(bakery_canvas)
+
+def test_render_summary():
+    assert_equal(render_summary('troy', 394382), 'Points: 100\nComments: 0\nGraded: 1/1\nScore (unweighted): 0.8\nScore (weighted): 0.8\nGroup Assignments: 0.8')
+    assert_equal(course_summary('annie', 679554).ratio_graded(), '10/10')
+
+def test_render_assignment():
+    assert_equal(render_assignment('annie', 679554, 7), 'Assignment not found: 7')
+    assert_equal(render_assignment('annie', 679554, 299650), '299650: Introduction\nGroup: Homework\nModule: Module 1\nGrade: 10.0/10 (A)')
+    assert_equal(render_assignment('annie', 679554, 553716), '553716: Basic Addition\nGroup: Homework\nModule: Module 2\nGrade: 14.0/15 (A)')
+    assert_equal(render_assignment('annie', 679554, 805499), '805499: Basic Subtraction\nGroup: Homework\nModule: Module 2\nGrade: 19.0/20 (A)')
+    assert_equal(render_assignment('annie', 134088, 937202), '937202: Technology in the outdoor classroom\nGroup: Homework\nModule: Module 2\nGrade: (missing)')
+    assert_equal(render_assignment('jeff', 386814, 24048), '24048: HOMEWORK 3\nGroup: Assignments\nModule: MODULE 1\nGrade: 58.0/100 (F)')
+
+def test_write_stream():
+    class Sink:
+        def __init__(self):
+            self.writes = []
+        def write(self, text):
+            self.writes.append(text)
+    lines = [str(index) + '\n' for index in range(7)]
+    sink = Sink()
+    write_stream(iter(lines), sink, chunk_size=3)
+    assert_equal(sink.writes, ['0\n1\n2\n', '3\n4\n5\n', '6\n'])
+    sink = Sink()
+    write_stream(iter([]), sink)
+    assert_equal(sink.writes, [])
+
+def test_render_all():
+    assert_equal(render_all('troy', 394382), '711675: Practical (graded)')
+    assert_equal(render_all('shirley', 679554), '299650: Introduction (graded)\n553716: Basic Addition (graded)\n805499: Basic Subtraction (graded)\n749969: Basic Multiplication (graded)\n763866: Basic Division (graded)\n979025: Midterm 1 (graded)\n870878: Logarithms (graded)\n126393: Antiderivatives (graded)\n122494: Actual Sorcery (graded)\n683132: Final Exam (graded)\n')
+
+def test_report_all():
+    canvas = fake_canvas.generate_canvas(courses=3, assignments=10)
+    # A course whose submissions cannot be fetched
+    canvas.submissions[('student0', 2)] = None
+    use_backend(canvas)
+    try:
+        lines = report_all('student0').splitlines()
+        assert_equal(lines[0], '1: ' + canvas.courses['student0'][0].code + ' | ' +
+                     format_report(course_summary('student0', 1)).rstrip('\n'))
+        assert_equal(lines[1].endswith(' | could not be fetched'), True)
+        assert_equal(len(lines), 3)
+    finally:
+        use_backend(bakery_canvas)
+
+def test_days_apart():
+    assert_equal(days_apart('2017-01-01T10:00:00+0000', '2017-01-05T09:00:00-0500'), 4)
+    assert_equal(days_apart('2017-01-05T10:00:00+0000', '2017-01-01T10:00:00+0000'), -4)
+
+def test_parse_timestamps():
+    timestamps = ['2017-01-23T10:00:00+0000', '2017-01-23T10:00:00Z',
+                  '2017-01-23T10:00:00-05:00', None, '2017-01-24T23:30:00+05:30']
+    def one_at_a_time(timestamps):
+        return [str(np.datetime64(parse_timestamp(timestamp).astimezone(timezone.utc)
+                                  .replace(tzinfo=None), 's')) if timestamp else 'NaT'
+                for timestamp in timestamps]
+    assert_equal([str(value) for value in parse_timestamps(timestamps)],
+                 one_at_a_time(timestamps))
+    # Fractional seconds are not the usual format, and are dropped
+    fractional = timestamps + ['2017-01-23T10:00:00.750+0000']
+    assert_equal([str(value) for value in parse_timestamps(fractional)],
+                 one_at_a_time(fractional[:-1]) + ['2017-01-23T10:00:00'])
+    assert_equal(len(parse_timestamps([None, ''])), 2)
+
+def test_lateness_stats():
+    group = fake_canvas.Group('Homework', 1.0)
+    due = ['2017-01-10T00:00:00+0000', '2017-01-20T12:00:00Z', '2017-01-30T00:00:00+0000', None]
+    submitted = ['2017-01-11T19:00:00-05:00', '2017-01-19T12:00:00Z', None,
+                 '2017-01-01T00:00:00+0000']
+    canvas = fake_canvas.FakeCanvas()
+    canvas.add_course('annie', fake_canvas.Course(1, 'Late', 'LATE101'),
+                      [fake_canvas.Submission(fake_canvas.Assignment(index, 'A', 'M', 10, due_at, group),
+                                              10, 'A', 'graded', [], submitted_at)
+                       for index, (due_at, submitted_at) in enumerate(zip(due, submitted))])
+    use_backend(canvas)
+    try:
+        # Two days late and one day early; the others are missing a date
+        assert_equal(lateness_stats('annie', 1),
+                     {'mean': 0.5, 'median': 0.5, 'percent_late': 50.0})
+    finally:
+        use_backend(bakery_canvas)
+
+def test_compact_submissions():
+    canvas = fake_canvas.generate_canvas(users=2, assignments=20)
+    first = canvas.get_submissions('student0', 1)
+    compact = compact_submissions(first)
+    assert_equal([format_assignment(record) for record in compact],
+                 [format_assignment(submission) for submission in first])
+    assert_equal([record.comments for record in compact],
+                 [tuple(submission.comments) for submission in first])
+    other = compact_submissions(canvas.get_submissions('student1', 1))
+    assert_equal(all(mine.assignment is theirs.assignment
+                     for mine, theirs in zip(compact, other)), True)
+
+def test_export():
+    use_backend(fake_canvas.generate_canvas(users=2, assignments=9))
+    try:
+        sink = io.StringIO()
+        written = canvas_export.write_csv(canvas_export.submission_batches(
+            [('student0', 1), ('student1', None)], batch_size=4), sink)
+        assert_equal(written, 18)
+        rows = sink.getvalue().splitlines()
+        assert_equal(rows[0].split(','), canvas_export.COLUMNS)
+        assert_equal(rows[1].split(',')[:3], ['student0', '1', '100000'])
+        assert_equal(rows[1].split(',')[13], '2017-01-02T23:59:00Z')
+    finally:
+        use_backend(bakery_canvas)
+
+def test_read_jobs():
+    assert_equal(read_jobs('# nightly\n\ntroy 394382 group Assignments\n'),
+                 [{'user_token': 'troy', 'course_id': 394382, 'command': 'group', 'args': ['Assignments']}])
+    assert_equal(read_jobs('[{"user_token": "troy", "command": "all"}]'),
+                 [{'user_token': 'troy', 'command': 'all', 'course_id': 0, 'args': []}])
+    assert_equal(read_jobs('troy 394382 group "Final Exam"\n  # indented\n')[0]['args'],
+                 ['Final Exam'])
+
+def test_run_batch():
+    results = list(run_batch(read_jobs('troy 394382 points\ntroy 394382 group Assignments\ntroy 394382 nope')))
+    assert_equal(results[0]['result'], 100)
+    assert_equal(results[1]['result'], 0.8)
+    assert_equal('error' in results[2], True)
+    # Malformed jobs fail on their own, without stopping the batch
+    results = list(run_batch([{'user_token': 'troy'}, [1], {'user_token': 'troy',
+                              'course_id': 394382, 'command': 'points'}]))
+    assert_equal(['error' in result for result in results], [True, True, False])
+    assert_equal(results[2]['result'], 100)
+
+def test_instruments():
+    fetch_cache.invalidate('troy')
+    instruments.enabled = True
+    try:
+        execute('points', 'troy', 394382)
+    finally:
+        instruments.enabled = False
+    record = instruments.records[-1]
+    assert_equal(record['command'], 'points')
+    assert_equal(record['backend_calls'], 1)
+    assert_equal(record['objects'], 1)
+
+def test_instruments_leave_out_input():
+    def slow_input(prompt):
+        time.sleep(0.2)
+        return 'Group 0'
+    use_backend(fake_canvas.generate_canvas())
+    original_input = builtins.input
+    builtins.input = slow_input
+    instruments.enabled = True
+    try:
+        execute('group', 'student0', 1)
+    finally:
+        instruments.enabled = False
+        builtins.input = original_input
+        use_backend(bakery_canvas)
+    record = instruments.records[-1]
+    assert_equal(record['command'], 'group')
+    assert_equal(record['input'] >= 0.2, True)
+    assert_equal(record['compute'] < 0.2, True)
+
+def test_grade_projection():
+    canvas = fake_canvas.generate_canvas(assignments=200, groups=5)
+    use_backend(canvas)
+    try:
+        projection = grade_projection('student0', 1)
+        submissions = canvas.submissions[('student0', 1)]
+        for index, submission in enumerate(submissions):
+            if submission.status != 'graded':
+                submissions[index] = fake_canvas.Submission(
+                    submission.assignment, 1.0, 'F', 'graded', [],
+                    submission.submitted_at, '2030-01-01T00:00:00+0000')
+        fetch_cache.invalidate()
+        assert_equal(grade_projection('student0', 1) is projection, True)
+        fresh = GradeProjection(course_frame('student0', 1))
+        assert_equal(projection.as_dict(), fresh.as_dict())
+        assert_equal([list(series) for series in projection.series()],
+                     [list(series) for series in fresh.series()])
+        # A graded submission without a score is NaN, updated or not
+        submissions[0] = fake_canvas.Submission(
+            submissions[0].assignment, None, None, 'graded', [],
+            submissions[0].submitted_at, '2031-01-01T00:00:00+0000')
+        fetch_cache.invalidate()
+        updated = grade_projection('student0', 1).as_dict()
+        fresh = GradeProjection(course_frame('student0', 1)).as_dict()
+        assert_equal([bool(np.isnan(value)) for value in updated.values()],
+                     [bool(np.isnan(value)) for value in fresh.values()])
+    finally:
+        use_backend(bakery_canvas)
+
+def test_projection_rebuilt_on_new_weights():
+    canvas = fake_canvas.generate_canvas(assignments=40, groups=4)
+    use_backend(canvas)
+    try:
+        before = project_grades('student0', 1)
+        submissions = canvas.submissions[('student0', 1)]
+        group = submissions[0].assignment.group
+        # Every assignment in the group shares this Group, so all of them change
+        group.weight *= 3
+        fetch_cache.invalidate()
+        fresh = GradeProjection(course_frame('student0', 1)).as_dict()
+        assert_equal(project_grades('student0', 1), fresh)
+        assert_equal(fresh == before, False)
+        # refresh throws the kept projections away too
+        execute('refresh', 'student0', 1)
+        assert_equal(list(projections), [])
+    finally:
+        use_backend(bakery_canvas)
+
+def test_projections_are_bounded():
+    use_backend(fake_canvas.generate_canvas(users=3, assignments=10))
+    limit = canvas_data.max_projections
+    canvas_data.max_projections = 2
+    try:
+        for user_token in ('student0', 'student1', 'student2'):
+            grade_projection(user_token, 1)
+        assert_equal(list(projections), [('student1', 1), ('student2', 1)])
+    finally:
+        canvas_data.max_projections = limit
+        use_backend(bakery_canvas)
+
+def test_what_if():
+    use_backend(fake_canvas.generate_canvas(assignments=120, groups=4))
+    try:
+        bounds = project_grades('student0', 1)
+        finals = simulate_grades(course_frame('student0', 1), 2000, seed=0)
+        assert_equal(bool(finals.min() >= bounds['min_score'] - 1e-9), True)
+        assert_equal(bool(finals.max() <= bounds['max_score'] + 1e-9), True)
+        outlook = what_if('student0', 1, 2000, seed=0)
+        assert_equal(round(sum(outlook['letters'].values()), 6), 1.0)
+        assert_equal(outlook, what_if('student0', 1, 2000, seed=0))
+    finally:
+        use_backend(bakery_canvas)
+
+def test_snapshot_store():
+    canvas = fake_canvas.generate_canvas(assignments=50)
+    store = canvas_snapshot.SnapshotStore(':memory:')
+    submissions = canvas.get_submissions('student0', 1)
+    assert_equal(store.load_submissions('student0', 1), None)
+    assert_equal(store.sync_submissions('student0', 1, submissions), 50)
+    assert_equal(store.sync_submissions('student0', 1, submissions), 0)
+    assert_equal(store.load_submissions('student0', 1), submissions)
+    submissions[0] = fake_canvas.Submission(submissions[0].assignment, 0.0, 'F', 'graded', [],
+                                            None, '2030-01-01T00:00:00+0000')
+    assert_equal(store.sync_submissions('student0', 1, submissions), 1)
+    # A comment added after grading is a change too
+    submissions[0].comments.append('See me after class')
+    assert_equal(store.sync_submissions('student0', 1, submissions), 1)
+    assert_equal(store.load_submissions('student0', 1)[0].comments, ['See me after class'])
+    store.save_courses('student0', canvas.get_courses('student0'))
+    use_backend(canvas_snapshot.SnapshotBackend(store))
+    try:
+        assert_equal(render_courses('student0'), '1: SYN1\n')
+        assert_equal(total_points('student0', 1), sum(submission.assignment.points_possible
+                                                      for submission in submissions))
+    finally:
+        use_backend(bakery_canvas)
+
+def test_score_sketch():
+    first = ScoreSketch()
+    first.add([10.0, 20.5, 30.5])
+    second = ScoreSketch()
+    second.add([40.5, 200.0])
+    first.merge(second)
+    assert_equal(first.count, 5)
+    assert_equal(first.above, 1)
+    assert_equal(first.quantile(0.0), 10.0)
+    assert_equal(first.quantile(1.0), 200.0)
+    assert_equal(first.mean(), 60.3)
+    assert_equal([type(first.quantile(q)) for q in (0.0, 0.5, 1.0)], [float] * 3)
+    assert_equal(ScoreSketch.from_dict(first.to_dict()).percentiles(), first.percentiles())
+
+def test_cohort_stats():
+    use_backend(fake_canvas.generate_canvas(users=6, assignments=40))
+    try:
+        roster = ['student' + str(user) for user in range(6)] + ['nobody']
+        inline = canvas_cohort.cohort_stats(1, roster, max_workers=1)
+        assert_equal(inline.missing, ['nobody'])
+        assert_equal(list(inline.averages), [average_weighted(user_token, 1)
+                                             for user_token in roster[:6]])
+        pooled = canvas_cohort.cohort_stats(1, roster, max_workers=2, chunk_size=2)
+        assert_equal(pooled.as_dict(), inline.as_dict())
+    finally:
+        use_backend(bakery_canvas)
+
+def test_fetch_cache():
+    canvas = fake_canvas.generate_canvas(users=2, assignments=5)
+    use_backend(canvas)
+    ttl, max_size = fetch_cache.ttl, fetch_cache.max_size
+    try:
+        hits, misses = fetch_cache.hits, fetch_cache.misses
+        fetch_submissions('student0', 1)
+        fetch_submissions('student0', 1)
+        assert_equal((canvas.calls, fetch_cache.hits - hits, fetch_cache.misses - misses), (1, 1, 1))
+        # Invalidating one user leaves the others cached
+        fetch_submissions('student1', 1)
+        fetch_cache.invalidate('student0')
+        fetch_submissions('student1', 1)
+        fetch_submissions('student0', 1)
+        assert_equal(canvas.calls, 3)
+        # Only the most recently used entry fits
+        fetch_cache.invalidate()
+        fetch_cache.max_size = 1
+        fetch_submissions('student1', 1)
+        fetch_submissions('student0', 1)
+        fetch_submissions('student0', 1)
+        fetch_submissions('student1', 1)
+        assert_equal(canvas.calls, 6)
+        # Every entry has expired as soon as it is stored
+        fetch_cache.ttl = 0
+        fetch_submissions('student1', 1)
+        assert_equal(canvas.calls, 7)
+    finally:
+        fetch_cache.ttl, fetch_cache.max_size = ttl, max_size
+        use_backend(bakery_canvas)
+
+def test_fetch_cache_derive():
+    cache = FetchCache()
+    first, second = ['first'], ['second']
+    cache.store('annie', 1, first)
+    assert_equal(cache.derive('annie', 1, 'length', first, lambda: 1), 1)
+    assert_equal(cache.derive('annie', 1, 'length', first, lambda: 2), 1)
+    # Built from data the entry no longer holds: returned, not cached
+    assert_equal(cache.derive('annie', 1, 'length', second, lambda: 3), 3)
+    cache.store('annie', 1, second)
+    assert_equal(cache.derive('annie', 1, 'length', first, lambda: 4), 4)
+    assert_equal(cache.derive('annie', 1, 'length', second, lambda: 5), 5)
+    assert_equal(cache.derive('annie', 1, 'length', second, lambda: 6), 5)
+
+def test_fetch_coalescing():
+    canvas = fake_canvas.generate_canvas(assignments=10, latency=0.1)
+    use_backend(canvas)
+    try:
+        coalesced = fetch_cache.coalesced
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(total_points('student0', 1)))
+                   for index in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert_equal(canvas.calls, 1)
+        assert_equal(fetch_cache.coalesced - coalesced, 7)
+        assert_equal(len(set(results)), 1)
+    finally:
+        use_backend(bakery_canvas)
+
+def test_async_fetch_coalescing():
+    import asyncio
+    import canvas_data_async
+    made_up = fake_canvas.generate_canvas(assignments=10)
+    for canvas in (fake_canvas.AsyncFakeCanvas(made_up.courses, made_up.submissions, 0.05),
+                   fake_canvas.FakeCanvas(made_up.courses, made_up.submissions, 0.05)):
+        use_backend(canvas)
+        try:
+            coalesced = fetch_cache.coalesced
+            calls = backend_limiter.calls
+            async def ask():
+                return await asyncio.gather(*[canvas_data_async.total_points('student0', 1)
+                                              for index in range(8)])
+            results = asyncio.run(ask())
+            assert_equal(canvas.calls, 1)
+            assert_equal(backend_limiter.calls - calls, 1)
+            assert_equal(fetch_cache.coalesced - coalesced, 7)
+            assert_equal(results, [total_points('student0', 1)] * 8)
+        finally:
+            use_backend(bakery_canvas)
+
+def test_async_fetch_outlives_timeout():
+    import asyncio
+    import canvas_data_async
+    made_up = fake_canvas.generate_canvas(courses=2, assignments=10)
+    canvas = fake_canvas.AsyncFakeCanvas(made_up.courses, made_up.submissions, 0.3)
+    use_backend(canvas)
+    try:
+        async def ask():
+            # The first gives up on the fetches the second is waiting for
+            return await asyncio.gather(canvas_data_async.report_all('student0', timeout=0.1),
+                                        canvas_data_async.report_all('student0', timeout=5))
+        impatient, patient = asyncio.run(ask())
+        assert_equal(impatient.count('timed out'), 2)
+        use_backend(made_up)
+        assert_equal(patient, report_all('student0'))
+        assert_equal(canvas.calls, 3)
+    finally:
+        use_backend(bakery_canvas)
+
+def test_async_matches_blocking():
+    import asyncio
+    import canvas_data_async
+    # More courses than max_concurrency_per_user, so that report_all waits
+    made_up = fake_canvas.generate_canvas(users=2, courses=6, assignments=20)
+    def ask(user_token):
+        return [count_courses(user_token), find_course(user_token, 1),
+                render_courses(user_token), total_points(user_token, 1),
+                ratio_graded(user_token, 1), average_weighted(user_token, 1),
+                render_summary(user_token, 1), render_all(user_token, 1),
+                report_all(user_token)]
+    async def ask_async(user_token):
+        return [await canvas_data_async.count_courses(user_token),
+                await canvas_data_async.find_course(user_token, 1),
+                await canvas_data_async.render_courses(user_token),
+                await canvas_data_async.total_points(user_token, 1),
+                await canvas_data_async.ratio_graded(user_token, 1),
+                await canvas_data_async.average_weighted(user_token, 1),
+                await canvas_data_async.render_summary(user_token, 1),
+                await canvas_data_async.render_all(user_token, 1),
+                await canvas_data_async.report_all(user_token)]
+    use_backend(made_up)
+    try:
+        expected = {user_token: ask(user_token) for user_token in ('student0', 'student1')}
+        use_backend(fake_canvas.AsyncFakeCanvas(made_up.courses, made_up.submissions, 0.01))
+        # Each run has its own event loop, and the last must not
+        # trip over the semaphores made in the first
+        for user_token in ('student0', 'student1', 'student0'):
+            fetch_cache.invalidate()
+            assert_equal(asyncio.run(ask_async(user_token)), expected[user_token])
+    finally:
+        use_backend(bakery_canvas)
+
+def test_server():
+    use_backend(fake_canvas.generate_canvas(assignments=30))
+    server = canvas_server.CanvasServer(('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+        connection.request('GET', '/run?user_token=student0&course_id=1&command=points')
+        assert_equal(json.loads(connection.getresponse().read())['result'],
+                     total_points('student0', 1))
+        connection.request('POST', '/run', json.dumps({'user_token': 'student0',
+                                                       'course_id': 1, 'command': 'nope'}))
+        assert_equal('error' in json.loads(connection.getresponse().read()), True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.csv')
+            connection.request('GET', '/run?user_token=student0&course_id=1&command=export&args=' + path)
+            assert_equal('error' in json.loads(connection.getresponse().read()), True)
+            assert_equal(os.path.exists(path), False)
+        for body in ('[1]', '{"course_id": null}', '{"args": 5}'):
+            connection.request('POST', '/run', body)
+            response = connection.getresponse()
+            assert_equal((response.status, 'error' in json.loads(response.read())), (400, True))
+        connection.request('GET', '/stats')
+        stats = json.loads(connection.getresponse().read())
+        assert_equal(stats['requests'], 3)
+        assert_equal(sorted(stats['latency_ms']), ['all', 'points', 'unknown'])
+    finally:
+        server.shutdown()
+        server.server_close()
+        use_backend(bakery_canvas)
+
+def test_render_charts():
+    import matplotlib
+    use_backend(fake_canvas.generate_canvas(users=2, assignments=20))
+    backend = matplotlib.get_backend()
+    matplotlib.use('pdf')
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            rendered = canvas_charts.render_roster(['student0', 'student1'], directory,
+                                                   'svg', max_workers=1)
+            assert_equal(sorted(os.path.basename(path) for path in rendered['student1']),
+                         ['student1_1_earliness.svg', 'student1_1_grades.svg',
+                          'student1_1_points.svg', 'student1_1_scores.svg'])
+            assert_equal(len(os.listdir(directory)), 8)
+        # Rendering right here leaves matplotlib's backend as it was
+        assert_equal(matplotlib.get_backend(), 'pdf')
+        # A chart that fails partway leaves nothing behind on the figure
+        try:
+            with canvas_data._drawing(None) as plt:
+                plt.plot([1, 2, 3])
+                raise RuntimeError('failed partway')
+        except RuntimeError:
+            pass
+        assert_equal(plt.gcf().axes, [])
+    finally:
+        matplotlib.use(backend)
+        use_backend(bakery_canvas)
+
+def test_import_time():
+    # A fresh interpreter, so nothing is already imported
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import canvas_data'],
+                            capture_output=True, text=True, check=True)
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == 'canvas_data':
+            cumulative = int(fields[1])
+    assert 0 < cumulative < IMPORT_TIME_BUDGET, cumulative
+
+def test_import_is_lazy():
+    result = subprocess.run([sys.executable, '-c',
+                             'import sys, canvas_data; print("matplotlib.pyplot" in sys.modules)'],
+                            capture_output=True, text=True, check=True)
+    assert_equal(result.stdout.strip(), 'False')
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+    print(str(student_tests.failures) + ' of ' + str(student_tests.tests) + ' checks failed')
+    sys.exit(1 if student_tests.failures else 0)